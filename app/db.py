@@ -1,13 +1,148 @@
-from sqlalchemy import create_engine
+import os
+import sqlite3
+from contextvars import ContextVar
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # SQLite database URL
 SQLALCHEMY_DATABASE_URL = "sqlite:///./cloud_access.db"
+# Optional replica for read-only traffic; defaults to the primary database
+READ_REPLICA_URL = os.environ.get("READ_REPLICA_URL")
+# Read connections pooled, and opened beyond that under load. Every admitted
+# request holds at most one (get_read_db is shared by all its dependencies),
+# so the two together cover the in-flight limits of all route classes in
+# app/utils/admission.py ROUTE_CLASS_LIMITS (60), "call" (32) included.
+READ_POOL_SIZE = 32
+READ_MAX_OVERFLOW = 32
+
+
+def create_engines(url: str, read_url: str | None = None):
+    """
+    Build the primary (read/write) engine and the read-only engine. Without a
+    replica URL, reads go to the same SQLite file through a separate pool of
+    query_only connections; WAL mode lets them run alongside the writer.
+    """
+    sqlite = url.startswith("sqlite")
+    connect_args = {"check_same_thread": False} if sqlite else {}  # SQLite
+    primary = create_engine(url, connect_args=connect_args)
+    if read_url is None:
+        read = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=READ_POOL_SIZE,
+            max_overflow=READ_MAX_OVERFLOW,
+        )
+    else:
+        read_args = (
+            {"check_same_thread": False} if read_url.startswith("sqlite") else {}
+        )
+        read = create_engine(
+            read_url,
+            connect_args=read_args,
+            pool_size=READ_POOL_SIZE,
+            max_overflow=READ_MAX_OVERFLOW,
+        )
+
+    if sqlite:
+        event.listen(primary, "connect", _enable_wal)
+    if read.dialect.name == "sqlite":
+        event.listen(read, "connect", _make_query_only)
+    return primary, read
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    # Persistent per database file; readers no longer block on the writer
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}  # SQLite
-)
+def _make_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+engine, read_engine = create_engines(SQLALCHEMY_DATABASE_URL, READ_REPLICA_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
+
+
+def _dispose_pools_after_fork():
+    # A forked worker must not reuse connections pooled by its parent; with
+    # close=False they are dropped without closing the parent's handles
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_pools_after_fork)
+
+# Per-request flags shared with the threadpool; set by RequestScopeMiddleware
+_request_scope: ContextVar[dict | None] = ContextVar("db_request_scope", default=None)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _mark_request_wrote(session):
+    scope = _request_scope.get()
+    if scope is not None:
+        scope["wrote"] = True
+
+
+def ReadSession():
+    # Session for read-only dependencies. Once the current request has
+    # committed a write, its later reads use the primary to see that write.
+    scope = _request_scope.get()
+    if scope is not None and scope.get("wrote"):
+        return SessionLocal()
+    return ReadSessionLocal()
+
+
+def get_read_db():
+    # The one read-session dependency: FastAPI resolves it once per request,
+    # so a route and its auth and access checks share a single connection.
+    db = ReadSession()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class RequestScopeMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_scope.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite leaves foreign keys (and so ON DELETE CASCADE) off per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+def upgrade_database(bind=engine):
+    # Apply pending Alembic migrations (app/migrations) up to head.
+    cfg = Config()
+    cfg.set_main_option("script_location", str(Path(__file__).parent / "migrations"))
+    with bind.connect() as connection:
+        cfg.attributes["connection"] = connection
+        command.upgrade(cfg, "head")
@@ -1,19 +1,66 @@
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from . import models
-from .db import engine
+from .db import RequestScopeMiddleware, upgrade_database
 from .routers.access_controls import router as ac_router
+from .routers.admin import router as admin_router
 from .routers.auth import router as auth_router
 from .routers.permissions import router as permissions_router
 from .routers.plans import router as plans_router
 from .routers.services import router as services_router
 from .routers.usage import router as usage_router
 from .routers.users import router as users_router
+from .utils.admission import AdmissionControlMiddleware
+from .utils.idempotency import IdempotencyMiddleware
+from .utils.plan_migration import resume_plan_migrations
+from .utils.purge import resume_purges
+from .utils.recorder import (
+    TRAFFIC_RECORD_PATH,
+    TrafficRecorderMiddleware,
+    traffic_recorder,
+)
+from .utils.tracing import TracingMiddleware, trace_exporter
+from .utils.upstream import upstream_proxy
+
+# Set to "0" when a launcher (scripts/serve.py) migrates once before forking
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "1") != "0"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs per worker at startup rather than at import, so preloading the app
+    # in a pre-fork parent opens no database connections
+    if MIGRATE_ON_STARTUP:
+        # Bring the database schema up to date with the migrations
+        upgrade_database()
+    # Finish purges and plan migrations interrupted by a crash or restart
+    resume_purges()
+    resume_plan_migrations()
+    yield
+    # Close pooled upstream connections and flush exported traces and
+    # recorded traffic on shutdown
+    await upstream_proxy.aclose()
+    trace_exporter.close()
+    if traffic_recorder is not None:
+        traffic_recorder.close()
+
 
-# Create all database tables based on models
-models.Base.metadata.create_all(bind=engine)
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# Tracks writes per request so later reads in it go to the primary
+app.add_middleware(RequestScopeMiddleware)
+# Retries replay saved responses; inside admission control, so its database
+# reads and writes are throttled with the requests they belong to
+app.add_middleware(IdempotencyMiddleware)
+# Shed load per route class before requests reach the thread pool
+app.add_middleware(AdmissionControlMiddleware)
+# Opt-in workload capture for scripts/replay_traffic.py
+if TRAFFIC_RECORD_PATH:
+    app.add_middleware(TrafficRecorderMiddleware)
+# Outermost, so traces include queueing and replay time
+app.add_middleware(TracingMiddleware)
 
 # Mount routers; each router defines its own prefix and tags
 app.include_router(users_router)
@@ -23,3 +70,4 @@ app.include_router(ac_router)
 app.include_router(usage_router)
 app.include_router(permissions_router)
 app.include_router(plans_router)
+app.include_router(admin_router)
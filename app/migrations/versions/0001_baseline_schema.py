@@ -0,0 +1,164 @@
+"""Baseline schema as previously created by metadata.create_all
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Databases created before migrations existed already have some or all of
+    # these tables, so only create what is missing.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "plans" not in existing:
+        op.create_table(
+            "plans",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(), nullable=True),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("max_calls_per_minute", sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_plans_id", "plans", ["id"], unique=False)
+        op.create_index("ix_plans_name", "plans", ["name"], unique=True)
+
+    if "permissions" not in existing:
+        op.create_table(
+            "permissions",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(), nullable=True),
+            sa.Column("service_name", sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_permissions_id", "permissions", ["id"], unique=False)
+        op.create_index("ix_permissions_name", "permissions", ["name"], unique=True)
+        op.create_index(
+            "ix_permissions_service_name",
+            "permissions",
+            ["service_name"],
+            unique=False,
+        )
+
+    if "plan_permissions" not in existing:
+        op.create_table(
+            "plan_permissions",
+            sa.Column("plan_id", sa.Integer(), nullable=False),
+            sa.Column("permission_id", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["permission_id"], ["permissions.id"]),
+            sa.ForeignKeyConstraint(["plan_id"], ["plans.id"]),
+            sa.PrimaryKeyConstraint("plan_id", "permission_id"),
+        )
+
+    if "cloud_services" not in existing:
+        op.create_table(
+            "cloud_services",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(), nullable=True),
+            sa.Column("description", sa.String(), nullable=True),
+            sa.Column("max_calls_per_minute", sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_cloud_services_id", "cloud_services", ["id"], unique=False)
+        op.create_index(
+            "ix_cloud_services_name", "cloud_services", ["name"], unique=True
+        )
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("username", sa.String(), nullable=True),
+            sa.Column("email", sa.String(), nullable=True),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+            sa.Column("role", sa.String(), nullable=True),
+            sa.Column("plan_id", sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(["plan_id"], ["plans.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+        op.create_index("ix_users_id", "users", ["id"], unique=False)
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    if "access_controls" not in existing:
+        op.create_table(
+            "access_controls",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("service_id", sa.Integer(), nullable=False),
+            sa.Column("permission", sa.String(), nullable=False),
+            sa.ForeignKeyConstraint(["service_id"], ["cloud_services.id"]),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(
+            "ix_access_controls_id", "access_controls", ["id"], unique=False
+        )
+
+    if "usage_records" not in existing:
+        op.create_table(
+            "usage_records",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("service_id", sa.Integer(), nullable=False),
+            sa.Column(
+                "timestamp",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=True,
+            ),
+            sa.ForeignKeyConstraint(["service_id"], ["cloud_services.id"]),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_usage_records_id", "usage_records", ["id"], unique=False)
+
+    if "idempotency_records" not in existing:
+        op.create_table(
+            "idempotency_records",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("key", sa.String(), nullable=False),
+            sa.Column("fingerprint", sa.String(), nullable=False),
+            sa.Column("status_code", sa.Integer(), nullable=False),
+            sa.Column("content_type", sa.String(), nullable=True),
+            sa.Column("body", sa.LargeBinary(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(
+            "ix_idempotency_records_created_at",
+            "idempotency_records",
+            ["created_at"],
+            unique=False,
+        )
+        op.create_index(
+            "ix_idempotency_records_id", "idempotency_records", ["id"], unique=False
+        )
+        op.create_index(
+            "ix_idempotency_records_key", "idempotency_records", ["key"], unique=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("idempotency_records")
+    op.drop_table("usage_records")
+    op.drop_table("access_controls")
+    op.drop_table("users")
+    op.drop_table("cloud_services")
+    op.drop_table("plan_permissions")
+    op.drop_table("permissions")
+    op.drop_table("plans")
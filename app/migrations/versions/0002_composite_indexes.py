@@ -0,0 +1,45 @@
+"""Composite indexes for access checks and rate limiting
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Remove duplicate grants, keeping the oldest, so the unique index applies
+    op.execute(
+        "DELETE FROM access_controls WHERE id NOT IN ("
+        "SELECT MIN(id) FROM access_controls "
+        "GROUP BY user_id, service_id, permission)"
+    )
+    op.create_index(
+        "ix_access_controls_user_service_permission",
+        "access_controls",
+        ["user_id", "service_id", "permission"],
+        unique=True,
+    )
+    op.create_index(
+        "ix_usage_records_user_service_timestamp",
+        "usage_records",
+        ["user_id", "service_id", "timestamp"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_usage_records_user_service_timestamp", "usage_records")
+    op.drop_index("ix_access_controls_user_service_permission", "access_controls")
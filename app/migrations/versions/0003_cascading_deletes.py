@@ -0,0 +1,138 @@
+"""Database-level cascading deletes on foreign keys
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _tables(ondelete_child, ondelete_plan):
+    # Target definitions of the rebuilt tables; SQLite cannot alter a foreign
+    # key in place, so batch mode copies each table into this shape.
+    meta = sa.MetaData()
+    plan_permissions = sa.Table(
+        "plan_permissions",
+        meta,
+        sa.Column(
+            "plan_id",
+            sa.Integer(),
+            sa.ForeignKey("plans.id", ondelete=ondelete_child),
+            primary_key=True,
+        ),
+        sa.Column(
+            "permission_id",
+            sa.Integer(),
+            sa.ForeignKey("permissions.id", ondelete=ondelete_child),
+            primary_key=True,
+        ),
+    )
+    users = sa.Table(
+        "users",
+        meta,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("role", sa.String(), nullable=True),
+        sa.Column(
+            "plan_id",
+            sa.Integer(),
+            sa.ForeignKey("plans.id", ondelete=ondelete_plan),
+            nullable=True,
+        ),
+        sa.Index("ix_users_email", "email", unique=True),
+        sa.Index("ix_users_id", "id"),
+        sa.Index("ix_users_username", "username", unique=True),
+    )
+    access_controls = sa.Table(
+        "access_controls",
+        meta,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete=ondelete_child),
+            nullable=False,
+        ),
+        sa.Column(
+            "service_id",
+            sa.Integer(),
+            sa.ForeignKey("cloud_services.id", ondelete=ondelete_child),
+            nullable=False,
+        ),
+        sa.Column("permission", sa.String(), nullable=False),
+        sa.Index("ix_access_controls_id", "id"),
+        sa.Index(
+            "ix_access_controls_user_service_permission",
+            "user_id",
+            "service_id",
+            "permission",
+            unique=True,
+        ),
+    )
+    usage_records = sa.Table(
+        "usage_records",
+        meta,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete=ondelete_child),
+            nullable=False,
+        ),
+        sa.Column(
+            "service_id",
+            sa.Integer(),
+            sa.ForeignKey("cloud_services.id", ondelete=ondelete_child),
+            nullable=False,
+        ),
+        sa.Column(
+            "timestamp",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=True,
+        ),
+        sa.Index("ix_usage_records_id", "id"),
+        sa.Index(
+            "ix_usage_records_user_service_timestamp",
+            "user_id",
+            "service_id",
+            "timestamp",
+        ),
+    )
+    return [plan_permissions, users, access_controls, usage_records]
+
+
+def _rebuild(tables) -> None:
+    # recreate="always" copies the rows into the new definition even though
+    # no individual column changes are listed
+    for table in tables:
+        with op.batch_alter_table(table.name, copy_from=table, recreate="always"):
+            pass
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _rebuild(_tables(ondelete_child="CASCADE", ondelete_plan="SET NULL"))
+    # Child lookups by service for cascades and chunked purges
+    op.create_index("ix_access_controls_service_id", "access_controls", ["service_id"])
+    op.create_index("ix_usage_records_service_id", "usage_records", ["service_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_usage_records_service_id", "usage_records")
+    op.drop_index("ix_access_controls_service_id", "access_controls")
+    _rebuild(_tables(ondelete_child=None, ondelete_plan=None))
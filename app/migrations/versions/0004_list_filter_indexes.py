@@ -0,0 +1,44 @@
+"""Indexes backing the list endpoint filters
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # (service_id, permission) also serves every lookup by service_id alone
+    op.drop_index("ix_access_controls_service_id", "access_controls")
+    op.create_index(
+        "ix_access_controls_service_id_permission",
+        "access_controls",
+        ["service_id", "permission"],
+    )
+    op.create_index("ix_access_controls_permission", "access_controls", ["permission"])
+    op.create_index("ix_users_plan_id_role", "users", ["plan_id", "role"])
+    op.create_index("ix_users_role", "users", ["role"])
+    op.create_index(
+        "ix_usage_records_user_timestamp", "usage_records", ["user_id", "timestamp"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_usage_records_user_timestamp", "usage_records")
+    op.drop_index("ix_users_role", "users")
+    op.drop_index("ix_users_plan_id_role", "users")
+    op.drop_index("ix_access_controls_permission", "access_controls")
+    op.drop_index("ix_access_controls_service_id_permission", "access_controls")
+    op.create_index("ix_access_controls_service_id", "access_controls", ["service_id"])
@@ -0,0 +1,36 @@
+"""Upstream backend settings for cloud services
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable columns, so SQLite can add them without rebuilding the table
+    op.add_column("cloud_services", sa.Column("upstream_url", sa.String()))
+    op.add_column("cloud_services", sa.Column("upstream_timeout_seconds", sa.Float()))
+    op.add_column("cloud_services", sa.Column("upstream_max_concurrency", sa.Integer()))
+    op.add_column("cloud_services", sa.Column("cache_ttl_seconds", sa.Integer()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("cloud_services") as batch_op:
+        batch_op.drop_column("cache_ttl_seconds")
+        batch_op.drop_column("upstream_max_concurrency")
+        batch_op.drop_column("upstream_timeout_seconds")
+        batch_op.drop_column("upstream_url")
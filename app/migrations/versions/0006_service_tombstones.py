@@ -0,0 +1,30 @@
+"""Tombstone column for services awaiting their usage purge
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable, so SQLite can add it without rebuilding the table
+    op.add_column("cloud_services", sa.Column("deleted_at", sa.DateTime()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("cloud_services") as batch_op:
+        batch_op.drop_column("deleted_at")
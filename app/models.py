@@ -1,8 +1,11 @@
 from sqlalchemy import (
     Column,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Table,
     func,
@@ -15,13 +18,28 @@ from .db import Base
 plan_permissions = Table(
     "plan_permissions",
     Base.metadata,
-    Column("plan_id", Integer, ForeignKey("plans.id"), primary_key=True),
-    Column("permission_id", Integer, ForeignKey("permissions.id"), primary_key=True),
+    Column(
+        "plan_id",
+        Integer,
+        ForeignKey("plans.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "permission_id",
+        Integer,
+        ForeignKey("permissions.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
 )
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # GET /users/ filters, plan migrations and ON DELETE SET NULL
+        Index("ix_users_plan_id_role", "plan_id", "role"),
+        Index("ix_users_role", "role"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
@@ -29,10 +47,12 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     role = Column(String, default="user")
 
+    # Child rows are removed by ON DELETE CASCADE, never loaded by the ORM
     usage_records = relationship(
         "UsageRecord",
         back_populates="user",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     # Link to individual access controls:
@@ -40,10 +60,13 @@ class User(Base):
         "AccessControl",
         back_populates="user",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     # Link to a subscription plan:
-    plan_id = Column(Integer, ForeignKey("plans.id"), nullable=True)
+    plan_id = Column(
+        Integer, ForeignKey("plans.id", ondelete="SET NULL"), nullable=True
+    )
     plan = relationship("Plan", back_populates="users")
 
 
@@ -57,22 +80,56 @@ class CloudService(Base):
     # Maximum allowed calls per minute (default is 60)
     max_calls_per_minute = Column(Integer, default=60)
 
+    # Backend that /services/{id}/call forwards to. A NULL timeout or cap
+    # uses the proxy defaults (app/utils/upstream.py); a NULL TTL never caches
+    upstream_url = Column(String, nullable=True)
+    upstream_timeout_seconds = Column(Float, nullable=True)
+    upstream_max_concurrency = Column(Integer, nullable=True)
+    cache_ttl_seconds = Column(Integer, nullable=True)
+
+    # Set when the service is deleted; the row is hidden from then on and
+    # removed once its usage history has been purged (app/utils/purge.py)
+    deleted_at = Column(DateTime, nullable=True)
+
     access_controls = relationship(
         "AccessControl",
         back_populates="service",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     # Optional backref for usage records
-    usage_records = relationship("UsageRecord", back_populates="service")
+    usage_records = relationship(
+        "UsageRecord",
+        back_populates="service",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
 
 class AccessControl(Base):
     __tablename__ = "access_controls"
+    __table_args__ = (
+        # One grant per (user, service, permission); also serves verify_access
+        Index(
+            "ix_access_controls_user_service_permission",
+            "user_id",
+            "service_id",
+            "permission",
+            unique=True,
+        ),
+        # Cascades, revocations and GET /access-controls/ filters by service
+        Index("ix_access_controls_service_id_permission", "service_id", "permission"),
+        Index("ix_access_controls_permission", "permission"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    service_id = Column(Integer, ForeignKey("cloud_services.id"), nullable=False)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    service_id = Column(
+        Integer, ForeignKey("cloud_services.id", ondelete="CASCADE"), nullable=False
+    )
     permission = Column(String, nullable=False)
 
     user = relationship("User", back_populates="access_controls")
@@ -81,10 +138,27 @@ class AccessControl(Base):
 
 class UsageRecord(Base):
     __tablename__ = "usage_records"
+    __table_args__ = (
+        # Per-user, per-service time window scans for rate limiting
+        Index(
+            "ix_usage_records_user_service_timestamp",
+            "user_id",
+            "service_id",
+            "timestamp",
+        ),
+        # Cascades and chunked purges by service
+        Index("ix_usage_records_service_id", "service_id"),
+        # GET /usage/me time ranges across all services
+        Index("ix_usage_records_user_timestamp", "user_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    service_id = Column(Integer, ForeignKey("cloud_services.id"), nullable=False)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    service_id = Column(
+        Integer, ForeignKey("cloud_services.id", ondelete="CASCADE"), nullable=False
+    )
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="usage_records")
@@ -103,6 +177,7 @@ class Permission(Base):
         "Plan",
         secondary=plan_permissions,
         back_populates="permissions",
+        passive_deletes=True,
     )
 
 
@@ -119,7 +194,40 @@ class Plan(Base):
         "Permission",
         secondary=plan_permissions,
         back_populates="plans",
+        passive_deletes=True,
     )
 
-    # Users subscribed to this plan
-    users = relationship("User", back_populates="plan")
+    # Users subscribed to this plan; their plan_id is cleared by ON DELETE SET NULL
+    users = relationship("User", back_populates="plan", passive_deletes=True)
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_records"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Hash of the caller, method, path and Idempotency-Key header
+    key = Column(String, unique=True, index=True, nullable=False)
+    # Hash of the original request, to reject reuse of a key for a different one
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+class PlanMigration(Base):
+    # Progress of a bulk plan migration (app/utils/plan_migration.py), kept in
+    # the database so any worker can report on it and resume it
+    __tablename__ = "plan_migrations"
+
+    id = Column(String, primary_key=True)
+    to_plan_id = Column(Integer, nullable=False)
+    from_plan_id = Column(Integer, nullable=True)
+    role = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="pending")
+    total = Column(Integer, nullable=False, default=0)
+    moved = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
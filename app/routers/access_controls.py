@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from .. import models, schemas
-from ..db import SessionLocal
+from ..db import SessionLocal, get_read_db
+from ..utils.access import grant_query
 
 router = APIRouter(prefix="/access-controls", tags=["access-controls"])
 
@@ -31,19 +33,11 @@ def assign_permission(
 
     # Verify service exists
     service = db.query(models.CloudService).get(ac_in.service_id)
-    if not service:
+    if not service or service.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Service not found")
 
     # Prevent duplicate assignment
-    exists = (
-        db.query(models.AccessControl)
-        .filter_by(
-            user_id=ac_in.user_id,
-            service_id=ac_in.service_id,
-            permission=ac_in.permission,
-        )
-        .first()
-    )
+    exists = grant_query(db, ac_in.user_id, ac_in.service_id, ac_in.permission).first()
     if exists:
         raise HTTPException(
             status_code=409,
@@ -56,7 +50,15 @@ def assign_permission(
         permission=ac_in.permission,
     )
     db.add(ac)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent identical grant
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="This permission is already assigned to the user for this service",
+        )
     db.refresh(ac)
     return ac
 
@@ -64,14 +66,31 @@ def assign_permission(
 @router.get(
     "/", response_model=List[schemas.AccessControl], status_code=status.HTTP_200_OK
 )
-def list_access_controls(db: Session = Depends(get_db)):
-    return db.query(models.AccessControl).all()
+def list_access_controls(
+    user_id: Optional[int] = None,
+    service_id: Optional[int] = None,
+    permission: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    return access_controls_query(db, user_id, service_id, permission).all()
+
+
+def access_controls_query(db: Session, user_id=None, service_id=None, permission=None):
+    # Every filter combination is served by an index on access_controls
+    query = db.query(models.AccessControl)
+    if user_id is not None:
+        query = query.filter(models.AccessControl.user_id == user_id)
+    if service_id is not None:
+        query = query.filter(models.AccessControl.service_id == service_id)
+    if permission is not None:
+        query = query.filter(models.AccessControl.permission == permission)
+    return query
 
 
 @router.get(
     "/{ac_id}", response_model=schemas.AccessControl, status_code=status.HTTP_200_OK
 )
-def get_access_control(ac_id: int, db: Session = Depends(get_db)):
+def get_access_control(ac_id: int, db: Session = Depends(get_read_db)):
     ac = db.query(models.AccessControl).get(ac_id)
     if not ac:
         raise HTTPException(status_code=404, detail="Access control not found")
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from ..utils.admission import admission
+from ..utils.profiler import MAX_PROFILE_SECONDS, ProfilerBusy, profiler
+from ..utils.security import require_admin
+from ..utils.tracing import trace_exporter
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.get("/admission", status_code=status.HTTP_200_OK)
+def admission_stats():
+    # In-flight counts, queue depths and shed counters per route class
+    return admission.stats()
+
+
+@router.get("/traces", status_code=status.HTTP_200_OK)
+def slow_traces(
+    min_duration_ms: float = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=200),
+):
+    # Slowest recently sampled traces, with their spans
+    return trace_exporter.slowest(min_duration_ms=min_duration_ms, limit=limit)
+
+
+@router.post("/profile", status_code=status.HTTP_200_OK)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    include_idle: bool = False,
+    collapsed: bool = Query(False, description="Return only the collapsed stacks"),
+):
+    """
+    Sample every thread of this worker for the given number of seconds and
+    return collapsed stacks plus hot spots in the routers, verify_access and
+    get_current_user.
+    """
+    try:
+        result = await profiler.profile(seconds, include_idle=include_idle)
+    except ProfilerBusy:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running in this worker",
+        )
+    if collapsed:
+        return PlainTextResponse(result["collapsed"])
+    return result
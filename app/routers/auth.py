@@ -6,11 +6,12 @@ from passlib.exc import UnknownHashError
 from sqlalchemy.orm import Session
 
 from .. import models, schemas
+from ..utils.recorder import annotate
 from ..utils.security import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_access_token,
     get_current_user,
-    get_db,
+    get_read_db,
     verify_password,
 )
 
@@ -20,7 +21,7 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 # Login
 @router.post("/token", response_model=schemas.Token)
 def login_for_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)
 ):
     user = (
         db.query(models.User).filter(models.User.username == form_data.username).first()
@@ -31,6 +32,7 @@ def login_for_token(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    annotate(user_id=user.id)
 
     # safely verify—even if hashed_password is bad
     try:
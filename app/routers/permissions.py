@@ -1,10 +1,10 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from .. import models, schemas
-from ..db import SessionLocal
+from ..db import SessionLocal, get_read_db
 
 router = APIRouter(prefix="/permissions", tags=["permissions"])
 
@@ -52,6 +52,16 @@ def create_permission(
 @router.get(
     "/", response_model=List[schemas.Permission], status_code=status.HTTP_200_OK
 )
-def list_permissions(db: Session = Depends(get_db)):
-    # Retrieve all Permission records
-    return db.query(models.Permission).all()
+def list_permissions(
+    service_name: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    return permissions_query(db, service_name).all()
+
+
+def permissions_query(db: Session, service_name=None):
+    # Permission records, optionally for one service (indexed)
+    query = db.query(models.Permission)
+    if service_name is not None:
+        query = query.filter(models.Permission.service_name == service_name)
+    return query
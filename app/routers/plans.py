@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from .. import models, schemas
-from ..db import SessionLocal
+from ..db import SessionLocal, get_read_db
 
 router = APIRouter(
     prefix="/plans",
@@ -51,7 +51,7 @@ def create_plan(
 
 
 @router.get("/", response_model=List[schemas.Plan], status_code=status.HTTP_200_OK)
-def list_plans(db: Session = Depends(get_db)):
+def list_plans(db: Session = Depends(get_read_db)):
     # Retrieve all Plan records
     return db.query(models.Plan).all()
 
@@ -1,12 +1,19 @@
+from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from .. import models, schemas
-from ..db import SessionLocal
-from ..utils.access import require_read_access
-from ..utils.security import get_current_user
+from ..db import SessionLocal, get_read_db
+from ..utils.access import count_recent_calls, require_read_access
+from ..utils.catalog import service_catalog
+from ..utils.pubsub import usage_broker
+from ..utils.purge import needs_background_purge, schedule_purge
+from ..utils.security import get_current_user, require_admin
+from ..utils.tracing import span
+from ..utils.upstream import upstream_proxy
 
 router = APIRouter(prefix="/services", tags=["services"])
 
@@ -28,10 +35,15 @@ def create_service(
     db: Session = Depends(get_db),
 ):
     # Prevent duplicates
-    if db.query(models.CloudService).filter_by(name=svc_in.name).first():
+    existing = db.query(models.CloudService).filter_by(name=svc_in.name).first()
+    if existing:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
-            detail="Service with that name already exists",
+            detail=(
+                "Service with that name is still being deleted"
+                if existing.deleted_at is not None
+                else "Service with that name already exists"
+            ),
         )
     svc = models.CloudService(
         name=svc_in.name,
@@ -40,14 +52,19 @@ def create_service(
     db.add(svc)
     db.commit()
     db.refresh(svc)
+    service_catalog.refresh(db)
     return svc
 
 
 @router.get(
     "/", response_model=List[schemas.CloudService], status_code=status.HTTP_200_OK
 )
-def list_services(db: Session = Depends(get_db)):
-    return db.query(models.CloudService).all()
+def list_services(db: Session = Depends(get_read_db)):
+    return (
+        db.query(models.CloudService)
+        .filter(models.CloudService.deleted_at.is_(None))
+        .all()
+    )
 
 
 @router.get(
@@ -55,8 +72,8 @@ def list_services(db: Session = Depends(get_db)):
     response_model=schemas.CloudService,
     status_code=status.HTTP_200_OK,
 )
-def get_service(service_id: int, db: Session = Depends(get_db)):
-    svc = db.query(models.CloudService).get(service_id)
+def get_service(service_id: int):
+    svc = service_catalog.get(service_id)
     if not svc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -74,7 +91,7 @@ def update_service(
     db: Session = Depends(get_db),
 ):
     svc = db.query(models.CloudService).get(service_id)
-    if not svc:
+    if not svc or svc.deleted_at is not None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Service not found",
@@ -83,52 +100,197 @@ def update_service(
     svc.description = svc_in.description
     db.commit()
     db.refresh(svc)
+    service_catalog.refresh(db)
     return svc
 
 
 @router.delete("/{service_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_service(service_id: int, db: Session = Depends(get_db)):
     svc = db.query(models.CloudService).get(service_id)
-    if not svc:
+    if not svc or svc.deleted_at is not None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Service not found",
         )
-    db.delete(svc)
+    if needs_background_purge(db, service_id):
+        # Tombstone the service and revoke every grant in one transaction, so
+        # it disappears at once; the row goes once its usage history has been
+        # purged in chunks, and resume_purges() finishes the job after a crash.
+        svc.deleted_at = datetime.utcnow()
+        db.query(models.AccessControl).filter(
+            models.AccessControl.service_id == service_id
+        ).delete(synchronize_session=False)
+        db.commit()
+        service_catalog.refresh(db)
+        schedule_purge(service_id)
+        return
+    # Grants and usage rows go with it via ON DELETE CASCADE
+    db.query(models.CloudService).filter(models.CloudService.id == service_id).delete(
+        synchronize_session=False
+    )
     db.commit()
+    service_catalog.refresh(db)
     return
 
 
+@router.get(
+    "/{service_id}/upstream",
+    response_model=schemas.ServiceUpstream,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(require_admin)],
+)
+def get_service_upstream(service_id: int, db: Session = Depends(get_read_db)):
+    svc = db.get(models.CloudService, service_id)
+    if not svc or svc.deleted_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Service not found",
+        )
+    return svc
+
+
+@router.put(
+    "/{service_id}/upstream",
+    response_model=schemas.ServiceUpstream,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(require_admin)],
+)
+def set_service_upstream(
+    service_id: int,
+    up_in: schemas.ServiceUpstream,
+    db: Session = Depends(get_db),
+):
+    svc = db.get(models.CloudService, service_id)
+    if not svc or svc.deleted_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Service not found",
+        )
+    if up_in.upstream_url and not up_in.upstream_url.startswith(
+        ("http://", "https://")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="upstream_url must be an http(s) URL",
+        )
+    svc.upstream_url = up_in.upstream_url
+    svc.upstream_timeout_seconds = up_in.upstream_timeout_seconds
+    svc.upstream_max_concurrency = up_in.upstream_max_concurrency
+    svc.cache_ttl_seconds = up_in.cache_ttl_seconds
+    db.commit()
+    db.refresh(svc)
+    service_catalog.refresh(db)
+    upstream_proxy.cache.invalidate(service_id)
+    return svc
+
+
+def _record_usage(db: Session, user: models.User, svc) -> models.UsageRecord:
+    # Log one call; it counts against the rate limit from this point on.
+    record = models.UsageRecord(
+        user_id=user.id,
+        service_id=svc.id,
+    )
+    with span("usage.commit"):
+        db.add(record)
+        db.commit()
+    return record
+
+
+def _refund_usage(db: Session, record: models.UsageRecord) -> None:
+    # Drop a call that never reached its upstream.
+    db.delete(record)
+    db.commit()
+
+
+def _publish_usage(db: Session, user: models.User, svc, record) -> None:
+    # Notify the user's open usage streams, if any.
+    if usage_broker.has_subscribers(user.id):
+        used = count_recent_calls(db, user.id, svc.id)
+        usage_broker.publish(
+            user.id,
+            {
+                "service_id": svc.id,
+                "timestamp": record.timestamp.isoformat(),
+                "calls_last_minute": used,
+                "limit": svc.max_calls_per_minute,
+                "remaining": max(svc.max_calls_per_minute - used, 0),
+            },
+        )
+
+
+def _log_call(db: Session, user: models.User, svc) -> models.UsageRecord:
+    record = _record_usage(db, user, svc)
+    _publish_usage(db, user, svc, record)
+    return record
+
+
+# Documents what call_service returns besides the stub's CloudService body
+CALL_RESPONSES = {
+    200: {
+        "description": (
+            "The service record for services without an upstream; otherwise "
+            "the upstream's response, relayed with its status code and "
+            "content type"
+        ),
+        "content": {"*/*": {"schema": {}}},
+        "headers": {
+            "X-Upstream-Cache": {
+                "description": "HIT or MISS; only on upstream responses",
+                "schema": {"type": "string"},
+            }
+        },
+    },
+    429: {"description": "Rate limit exceeded"},
+    502: {"description": "The upstream is unreachable"},
+    503: {"description": "Too many concurrent calls to the upstream"},
+    504: {"description": "The upstream timed out"},
+}
+
+
 @router.get(
     "/{service_id}/call",
     response_model=schemas.CloudService,
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(require_read_access)],
+    responses=CALL_RESPONSES,
 )
-def call_service(
+async def call_service(
     service_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
     """
-    Dummy endpoint that simulates calling the cloud service.
-    Only users with the "read" permission may access it.
-    Also logs usage on each successful call.
+    Forward the call to the service's upstream backend, passing the query
+    string along, and relay its response. Services without an upstream
+    return their own record. Only users with the "read" permission may
+    access it. Also logs usage on each call that got a response.
     """
-    svc = db.query(models.CloudService).get(service_id)
+    # verify_access has already looked the service up (reloading the catalog
+    # if needed), so read the snapshot without touching the database here on
+    # the event loop
+    svc = service_catalog.peek(service_id)
     if not svc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Service not found",
         )
+    if svc.upstream_url is None:
+        await run_in_threadpool(_log_call, db, current_user, svc)
+        return svc
 
-    # --- Usage tracking ---
-    record = models.UsageRecord(
-        user_id=current_user.id,
-        service_id=service_id,
+    # Usage is recorded before forwarding, so calls still waiting on the
+    # upstream count against the rate limit; it is refunded on failure
+    record = await run_in_threadpool(_record_usage, db, current_user, svc)
+    try:
+        upstream = await upstream_proxy.call(svc, request.url.query)
+    except HTTPException:
+        await run_in_threadpool(_refund_usage, db, record)
+        raise
+    await run_in_threadpool(_publish_usage, db, current_user, svc, record)
+    return Response(
+        content=upstream.body,
+        status_code=upstream.status_code,
+        media_type=upstream.content_type,
+        headers={"X-Upstream-Cache": "HIT" if upstream.cached else "MISS"},
     )
-    db.add(record)
-    db.commit()
-    # ------------------------
-
-    return svc
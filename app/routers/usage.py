@@ -1,36 +1,153 @@
-from typing import List
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from .. import models, schemas
-from ..db import SessionLocal
+from ..db import ReadSession, get_read_db
+from ..utils.catalog import service_catalog
+from ..utils.pubsub import TooManyStreams, usage_broker
 from ..utils.security import get_current_user
 
+# Seconds between keep-alive comments on an idle usage stream
+HEARTBEAT_SECONDS = 15
+
 router = APIRouter(
     prefix="/usage",
     tags=["usage"],
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get(
     "/me", response_model=List[schemas.UsageRecord], status_code=status.HTTP_200_OK
 )
 def get_my_usage(
+    service_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    # Query all UsageRecord rows for the authenticated user
-    return (
-        db.query(models.UsageRecord)
-        .filter(models.UsageRecord.user_id == current_user.id)
-        .all()
+    return usage_query(db, current_user.id, service_id, since, until).all()
+
+
+def usage_query(db: Session, user_id: int, service_id=None, since=None, until=None):
+    # The user's UsageRecord rows, optionally for one service and a time
+    # range; (user_id[, service_id], timestamp) is indexed
+    query = db.query(models.UsageRecord).filter(models.UsageRecord.user_id == user_id)
+    if service_id is not None:
+        query = query.filter(models.UsageRecord.service_id == service_id)
+    if since is not None:
+        query = query.filter(models.UsageRecord.timestamp >= _as_utc(since))
+    if until is not None:
+        query = query.filter(models.UsageRecord.timestamp < _as_utc(until))
+    return query
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Timestamps are stored as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _quota_snapshot(user_id: int) -> list[dict]:
+    # Remaining per-minute quota for every service the user holds a grant on
+    db = ReadSession()
+    try:
+        cutoff = datetime.utcnow() - timedelta(minutes=1)
+        service_ids = [
+            sid
+            for (sid,) in db.query(models.AccessControl.service_id)
+            .filter(models.AccessControl.user_id == user_id)
+            .distinct()
+        ]
+        used = dict(
+            db.query(models.UsageRecord.service_id, func.count())
+            .filter(
+                models.UsageRecord.user_id == user_id,
+                models.UsageRecord.service_id.in_(service_ids),
+                models.UsageRecord.timestamp >= cutoff,
+            )
+            .group_by(models.UsageRecord.service_id)
+            .all()
+        )
+    finally:
+        db.close()
+
+    snapshot = []
+    for sid in service_ids:
+        svc = service_catalog.get(sid)
+        if svc is None:
+            continue
+        calls = used.get(sid, 0)
+        snapshot.append(
+            {
+                "service_id": sid,
+                "calls_last_minute": calls,
+                "limit": svc.max_calls_per_minute,
+                "remaining": max(svc.max_calls_per_minute - calls, 0),
+            }
+        )
+    return snapshot
+
+
+class _UsageStreamResponse(StreamingResponse):
+    # Owns the subscription from the moment the endpoint returns, so it is
+    # released even if the client disconnects before the first event.
+
+    def __init__(self, sub, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.sub = sub
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            usage_broker.unsubscribe(self.sub)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/me/stream", status_code=status.HTTP_200_OK)
+async def stream_my_usage(current_user: models.User = Depends(get_current_user)):
+    """
+    Server-sent events: a "quota" event with the current per-service quota,
+    then a "usage" event for every call the user makes. Streams that fall
+    too far behind get a "dropped" event and are closed.
+    """
+    try:
+        sub = usage_broker.subscribe(current_user.id)
+    except TooManyStreams:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many open usage streams",
+        )
+
+    async def events():
+        yield _sse("quota", await run_in_threadpool(_quota_snapshot, sub.user_id))
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if event is None:
+                yield _sse("dropped", {"detail": "Consumer too slow"})
+                return
+            yield _sse("usage", event)
+
+    return _UsageStreamResponse(
+        sub,
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
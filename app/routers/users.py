@@ -1,8 +1,12 @@
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from .. import models, schemas
-from ..db import SessionLocal
+from ..db import SessionLocal, get_read_db
+from ..utils.admission import admission
+from ..utils.plan_migration import create_job, get_job, start_plan_migration
 from ..utils.security import hash_password, require_admin
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -47,12 +51,69 @@ def create_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(require_admin)],
 )
-def list_users(db: Session = Depends(get_db)):
-    return db.query(models.User).all()
+def list_users(
+    plan_id: Optional[int] = None,
+    role: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    return users_query(db, plan_id, role).all()
+
+
+def users_query(db: Session, plan_id=None, role=None):
+    # Filters are served by the (plan_id, role) and role indexes
+    query = db.query(models.User)
+    if plan_id is not None:
+        query = query.filter(models.User.plan_id == plan_id)
+    if role is not None:
+        query = query.filter(models.User.role == role)
+    return query
+
+
+@router.post(
+    "/plan-migrations",
+    response_model=schemas.PlanMigration,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin)],
+)
+def create_plan_migration(
+    m_in: schemas.PlanMigrationCreate,
+    db: Session = Depends(get_db),
+):
+    # Move every user matching the filter to another plan, in chunks
+    for plan_id in (m_in.to_plan_id, m_in.from_plan_id):
+        if plan_id is not None and not db.get(models.Plan, plan_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Plan {plan_id} not found",
+            )
+    if m_in.from_plan_id == m_in.to_plan_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Source and target plan are the same",
+        )
+    job = create_job(db, m_in.to_plan_id, m_in.from_plan_id, m_in.role)
+    start_plan_migration(job.id)
+    return job
+
+
+@router.get(
+    "/plan-migrations/{job_id}",
+    response_model=schemas.PlanMigration,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(require_admin)],
+)
+def get_plan_migration(job_id: str, db: Session = Depends(get_read_db)):
+    job = get_job(db, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Plan migration not found",
+        )
+    return job
 
 
 @router.get("/{user_id}", response_model=schemas.User, status_code=status.HTTP_200_OK)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+def get_user(user_id: int, db: Session = Depends(get_read_db)):
     user = db.query(models.User).get(user_id)
     if not user:
         raise HTTPException(
@@ -60,3 +121,54 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
             detail="User not found",
         )
     return user
+
+
+@router.delete(
+    "/{user_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require_admin)],
+)
+def delete_user(user_id: int, db: Session = Depends(get_db)):
+    # Grants and usage rows are removed by ON DELETE CASCADE in the same statement
+    deleted = (
+        db.query(models.User)
+        .filter(models.User.id == user_id)
+        .delete(synchronize_session=False)
+    )
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+    db.commit()
+    return
+
+
+@router.put(
+    "/{user_id}/plan",
+    response_model=schemas.User,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(require_admin)],
+)
+def assign_plan(
+    user_id: int,
+    p_in: schemas.UserUpdatePlan,
+    db: Session = Depends(get_db),
+):
+    user = db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+    if not db.get(models.Plan, p_in.plan_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Plan not found",
+        )
+    user.plan_id = p_in.plan_id
+    db.commit()
+    db.refresh(user)
+    # Queue priority is derived from the plan
+    admission.invalidate_weights((user.username,))
+    return user
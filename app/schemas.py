@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # File to define schemas
 
@@ -28,6 +28,27 @@ class UserUpdatePlan(BaseModel):
     plan_id: int
 
 
+class PlanMigrationCreate(BaseModel):
+    to_plan_id: int
+    # Only move users currently on this plan (all plans if omitted)
+    from_plan_id: Optional[int] = None
+    # Only move users with this role
+    role: Optional[str] = None
+
+
+class PlanMigration(PlanMigrationCreate):
+    id: str
+    status: str
+    total: int
+    moved: int
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
 class PermissionBase(BaseModel):
     name: str
     service_name: str
@@ -79,6 +100,19 @@ class CloudService(CloudServiceBase):
         orm_mode = True
 
 
+class ServiceUpstream(BaseModel):
+    # Backend that service calls are forwarded to; None keeps the stub
+    upstream_url: Optional[str] = None
+    # Proxy defaults apply when these are omitted
+    upstream_timeout_seconds: Optional[float] = Field(None, gt=0)
+    upstream_max_concurrency: Optional[int] = Field(None, gt=0)
+    # Seconds a successful upstream GET is reused for; omitted never caches
+    cache_ttl_seconds: Optional[int] = Field(None, ge=0)
+
+    class Config:
+        orm_mode = True
+
+
 class AccessControlBase(BaseModel):
     permission: str
 
@@ -4,39 +4,47 @@ from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from .. import models
-from ..db import SessionLocal
+from ..db import get_read_db
+from .catalog import service_catalog
 from .security import get_current_user
+from .tracing import traced
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def grant_query(db: Session, user_id: int, service_id: int, permission: str):
+    # The user's grant of one permission on one service, if any
+    return db.query(models.AccessControl).filter_by(
+        user_id=user_id, service_id=service_id, permission=permission
+    )
+
+
+def recent_calls_query(db: Session, user_id: int, service_id: int):
+    # Calls by the user to the service within the rate-limit window
+    cutoff = datetime.utcnow() - timedelta(minutes=1)
+    return db.query(models.UsageRecord).filter(
+        models.UsageRecord.user_id == user_id,
+        models.UsageRecord.service_id == service_id,
+        models.UsageRecord.timestamp >= cutoff,
+    )
 
 
+def count_recent_calls(db: Session, user_id: int, service_id: int) -> int:
+    return recent_calls_query(db, user_id, service_id).count()
+
+
+@traced("verify_access")
 def verify_access(
     service_id: int,
     permission: str,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    # Ensure the service exists
-    svc = db.query(models.CloudService).get(service_id)
+    # Ensure the service exists (from the in-process catalog, no DB round-trip)
+    svc = service_catalog.get(service_id)
     if not svc:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Service not found")
 
     # Check permission
-    has_perm = (
-        db.query(models.AccessControl)
-        .filter_by(
-            user_id=current_user.id,
-            service_id=service_id,
-            permission=permission,
-        )
-        .first()
-    )
+    has_perm = grant_query(db, current_user.id, service_id, permission).first()
     if not has_perm:
         raise HTTPException(
             status.HTTP_403_FORBIDDEN,
@@ -45,16 +53,7 @@ def verify_access(
 
     # Enforce per-minute rate limit
     limit = svc.max_calls_per_minute
-    cutoff = datetime.utcnow() - timedelta(minutes=1)
-    recent_count = (
-        db.query(models.UsageRecord)
-        .filter(
-            models.UsageRecord.user_id == current_user.id,
-            models.UsageRecord.service_id == service_id,
-            models.UsageRecord.timestamp >= cutoff,
-        )
-        .count()
-    )
+    recent_count = count_recent_calls(db, current_user.id, service_id)
     if recent_count >= limit:
         raise HTTPException(
             status.HTTP_429_TOO_MANY_REQUESTS,
@@ -67,14 +66,20 @@ def verify_access(
     return True
 
 
+@traced("require_read_access")
+def _verify_read(
+    service_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    # Typed so service_id arrives as an int, matching the catalog keys
+    return verify_access(service_id, "read", current_user, db)
+
+
 # Helper function
 def require_read_access(
     service_id: int,
-    _ok: bool = Depends(
-        lambda service_id, current_user=Depends(get_current_user), db=Depends(
-            get_db
-        ): verify_access(service_id, "read", current_user, db)
-    ),
+    _ok: bool = Depends(_verify_read),
 ):
     """
     Dummy dependency that binds service_id to verify_access(..., "read")
@@ -0,0 +1,311 @@
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from starlette.responses import JSONResponse
+
+from .. import models
+from ..db import ReadSession
+from .security import decode_access_token
+
+# Concurrency limit and wait-queue size for each route class
+ROUTE_CLASS_LIMITS = {
+    "auth": {"max_in_flight": 8, "max_queue": 32},
+    "call": {"max_in_flight": 32, "max_queue": 128},
+    "admin": {"max_in_flight": 4, "max_queue": 16},
+    "list": {"max_in_flight": 16, "max_queue": 64},
+}
+# Longest time a request may wait in a queue before it is shed
+MAX_QUEUE_WAIT_SECONDS = 5.0
+# Value of the Retry-After header sent with shed requests
+RETRY_AFTER_SECONDS = 1
+# How long a resolved plan weight is trusted before it is looked up again.
+# invalidate_weights() only reaches its own worker, so this also bounds how
+# long other workers keep using a weight after a plan change
+PLAN_WEIGHT_TTL_SECONDS = 60
+PLAN_WEIGHT_CACHE_SIZE = 10_000
+# Admins are always served ahead of any plan
+ADMIN_WEIGHT = 1_000_000
+# Anonymous callers, and users whose plan is not cached yet
+DEFAULT_WEIGHT = 0
+
+# Paths that bypass admission control so docs and monitoring stay reachable;
+# long-lived usage streams are capped per user instead of holding a slot
+EXEMPT_PATHS = (
+    "/docs",
+    "/redoc",
+    "/openapi.json",
+    "/admin/admission",
+    "/admin/profile",
+    "/usage/me/stream",
+)
+
+# (route class, method or None for any, path) checked in order before the
+# method-based default below
+ROUTE_RULES = (
+    ("auth", None, re.compile(r"^/auth(/|$)")),
+    # Public sign-up; password hashing makes it cost about as much as a login
+    ("auth", "POST", re.compile(r"^/users/?$")),
+    ("call", None, re.compile(r"^/services/\d+/call/?$")),
+    ("admin", None, re.compile(r"^/admin(/|$)")),
+)
+
+
+def classify_route(method: str, path: str) -> str:
+    # Map a request onto one of the route classes in ROUTE_CLASS_LIMITS.
+    for route_class, rule_method, pattern in ROUTE_RULES:
+        if rule_method in (None, method) and pattern.match(path):
+            return route_class
+    # Every other write manages services, plans, grants or users
+    if method not in ("GET", "HEAD"):
+        return "admin"
+    return "list"
+
+
+class Shed(Exception):
+    # Raised when a request is rejected instead of admitted.
+    pass
+
+
+@dataclass
+class _Gate:
+    max_in_flight: int
+    max_queue: int
+    in_flight: int = 0
+    admitted: int = 0
+    shed_queue_full: int = 0
+    shed_timeout: int = 0
+    shed_preempted: int = 0
+    # Heap of (-weight, seq, future); the highest weight is served first
+    waiters: list = field(default_factory=list)
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "admitted": self.admitted,
+            "shed": {
+                "queue_full": self.shed_queue_full,
+                "timeout": self.shed_timeout,
+                "preempted": self.shed_preempted,
+            },
+        }
+
+
+class AdmissionController:
+    """
+    Caps in-flight requests per route class. Requests beyond the cap wait in a
+    bounded queue ordered by plan weight; when the queue is full a heavier
+    request preempts the lightest waiter, otherwise it is shed.
+    """
+
+    def __init__(self, limits: dict = ROUTE_CLASS_LIMITS):
+        self._gates = {name: _Gate(**cfg) for name, cfg in limits.items()}
+        self._seq = itertools.count()
+        # username -> (weight, expires_at), least recently used first
+        self._weights: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        # Usernames whose weight is being looked up
+        self._loading: set[str] = set()
+        # Bumped by invalidate_weights(), so lookups started before it are
+        # not cached
+        self._generation = 0
+        # Loop that owns the weight cache, set by the first lookup
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def acquire(self, route_class: str, weight: int) -> None:
+        gate = self._gates[route_class]
+        if gate.in_flight < gate.max_in_flight and not gate.waiters:
+            gate.in_flight += 1
+            gate.admitted += 1
+            return
+
+        if len(gate.waiters) >= gate.max_queue:
+            # Evict the lightest waiter if this request outranks it
+            lightest = max(gate.waiters)
+            if -lightest[0] >= weight:
+                gate.shed_queue_full += 1
+                raise Shed()
+            gate.waiters.remove(lightest)
+            heapq.heapify(gate.waiters)
+            gate.shed_preempted += 1
+            if not lightest[2].done():
+                lightest[2].set_exception(Shed())
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (-weight, next(self._seq), fut)
+        heapq.heappush(gate.waiters, entry)
+        try:
+            # The slot is handed over by release(), so in_flight is already counted
+            await asyncio.wait_for(asyncio.shield(fut), MAX_QUEUE_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.exception():
+                # Granted just as the wait expired; keep the slot
+                gate.admitted += 1
+                return
+            if entry in gate.waiters:
+                gate.waiters.remove(entry)
+                heapq.heapify(gate.waiters)
+            gate.shed_timeout += 1
+            raise Shed()
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot we may have been handed
+            if entry in gate.waiters:
+                gate.waiters.remove(entry)
+                heapq.heapify(gate.waiters)
+            elif fut.done() and not fut.exception():
+                self.release(route_class)
+            raise
+        gate.admitted += 1
+
+    def release(self, route_class: str) -> None:
+        gate = self._gates[route_class]
+        # Hand the slot straight to the heaviest live waiter
+        while gate.waiters:
+            _, _, fut = heapq.heappop(gate.waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        gate.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {name: gate.stats() for name, gate in self._gates.items()}
+
+    def weight_for(self, headers: dict) -> int:
+        # Resolve the caller's priority from the bearer token's user and plan.
+        # Never waits on the database: a user missing from the cache is
+        # admitted at DEFAULT_WEIGHT, and an expired entry is still used,
+        # while the plan is looked up in the background for later requests.
+        auth = headers.get("authorization", "")
+        if not auth.lower().startswith("bearer "):
+            return DEFAULT_WEIGHT
+        username = decode_access_token(auth[7:]).get("sub")
+        if username is None:
+            return DEFAULT_WEIGHT
+
+        cached = self._weights.get(username)
+        if cached is None:
+            self._load_in_background(username)
+            return DEFAULT_WEIGHT
+        self._weights.move_to_end(username)
+        weight, expires_at = cached
+        if expires_at <= time.monotonic():
+            self._load_in_background(username)
+        return weight
+
+    def _load_in_background(self, username: str) -> None:
+        # One lookup per user at a time, on the event loop's default executor
+        # rather than the request thread pool.
+        if username in self._loading:
+            return
+        self._loading.add(username)
+        generation = self._generation
+        loop = self._loop = asyncio.get_running_loop()
+        lookup = loop.run_in_executor(None, _load_weight, username)
+
+        def store(fut: asyncio.Future) -> None:
+            # Runs on the event loop once the lookup finishes
+            self._loading.discard(username)
+            if fut.cancelled() or fut.exception() is not None:
+                return
+            if generation != self._generation:
+                return
+            self._weights[username] = (
+                fut.result(),
+                time.monotonic() + PLAN_WEIGHT_TTL_SECONDS,
+            )
+            self._weights.move_to_end(username)
+            while len(self._weights) > PLAN_WEIGHT_CACHE_SIZE:
+                self._weights.popitem(last=False)
+
+        lookup.add_done_callback(store)
+
+    def invalidate_weights(self, usernames=None) -> None:
+        # Drop cached plan weights, for the given users or for everyone. The
+        # cache is only touched on its event loop, so calls from other threads
+        # (sync handlers, the plan-migration job) are handed over to it.
+        loop = self._loop
+        if loop is not None and not _running_on(loop):
+            try:
+                loop.call_soon_threadsafe(self._invalidate, usernames)
+                return
+            except RuntimeError:
+                # The loop has been closed; nothing else uses the cache now
+                pass
+        self._invalidate(usernames)
+
+    def _invalidate(self, usernames) -> None:
+        self._generation += 1
+        if usernames is None:
+            self._weights.clear()
+            return
+        for username in usernames:
+            self._weights.pop(username, None)
+
+
+def _running_on(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def _load_weight(username: str) -> int:
+    db = ReadSession()
+    try:
+        row = (
+            db.query(models.User.role, models.Plan.max_calls_per_minute)
+            .outerjoin(models.Plan, models.User.plan_id == models.Plan.id)
+            .filter(models.User.username == username)
+            .first()
+        )
+    finally:
+        db.close()
+    if row is None:
+        return 0
+    role, plan_calls = row
+    if role == "admin":
+        return ADMIN_WEIGHT
+    # Plans with a larger call allowance are the premium tiers
+    return plan_calls or 0
+
+
+# Shared controller used by the middleware and the monitoring endpoint
+admission = AdmissionController()
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        route_class = classify_route(scope["method"], scope["path"])
+        headers = {
+            k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]
+        }
+        weight = self.controller.weight_for(headers)
+        try:
+            await self.controller.acquire(route_class, weight)
+        except Shed:
+            response = JSONResponse(
+                {"detail": "Server is overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
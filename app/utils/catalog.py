@@ -0,0 +1,119 @@
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from .. import models
+from ..db import ReadSession
+
+# Longest time a snapshot is served before it is reloaded, so changes made
+# through other worker processes are picked up
+SNAPSHOT_MAX_AGE_SECONDS = 30.0
+
+
+@dataclass(frozen=True)
+class ServiceEntry:
+    id: int
+    name: str
+    description: str | None
+    max_calls_per_minute: int
+    # Upstream backend calls are forwarded to; None keeps the stub response
+    upstream_url: str | None = None
+    upstream_timeout_seconds: float | None = None
+    upstream_max_concurrency: int | None = None
+    cache_ttl_seconds: int | None = None
+
+
+class ServiceCatalog:
+    """
+    Immutable in-process snapshot of the cloud_services table. Readers take
+    the current mapping without locking; writers build a new mapping and swap
+    it in whole, so a reader never sees a half-applied change.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self) -> MappingProxyType:
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is None or now - self._loaded_at > SNAPSHOT_MAX_AGE_SECONDS:
+            snapshot = self.refresh(if_loaded_before=now - SNAPSHOT_MAX_AGE_SECONDS)
+        return snapshot
+
+    def get(self, service_id: int) -> ServiceEntry | None:
+        missed_at = time.monotonic()
+        entry = self._current().get(service_id)
+        # A service created through another worker is not in this snapshot
+        # yet; reload once if the row exists rather than 404 until expiry
+        if entry is None and _service_exists(service_id):
+            entry = self.refresh(if_loaded_before=missed_at).get(service_id)
+        return entry
+
+    def peek(self, service_id: int) -> ServiceEntry | None:
+        # The entry in the current snapshot, never reloading, so it is safe on
+        # the event loop; for callers that already went through get().
+        snapshot = self._snapshot
+        return snapshot.get(service_id) if snapshot is not None else None
+
+    def all(self) -> list[ServiceEntry]:
+        return list(self._current().values())
+
+    def refresh(
+        self, db=None, if_loaded_before: float | None = None
+    ) -> MappingProxyType:
+        # Rebuild from the database and atomically replace the snapshot. With
+        # if_loaded_before, skip the reload when another thread already did it
+        # while this one waited for the lock.
+        with self._lock:
+            if (
+                if_loaded_before is not None
+                and self._snapshot is not None
+                and self._loaded_at > if_loaded_before
+            ):
+                return self._snapshot
+            own_session = db is None
+            if own_session:
+                db = ReadSession()
+            try:
+                rows = (
+                    db.query(models.CloudService)
+                    .filter(models.CloudService.deleted_at.is_(None))
+                    .order_by(models.CloudService.id)
+                )
+                snapshot = MappingProxyType(
+                    {
+                        svc.id: ServiceEntry(
+                            id=svc.id,
+                            name=svc.name,
+                            description=svc.description,
+                            max_calls_per_minute=svc.max_calls_per_minute,
+                            upstream_url=svc.upstream_url,
+                            upstream_timeout_seconds=svc.upstream_timeout_seconds,
+                            upstream_max_concurrency=svc.upstream_max_concurrency,
+                            cache_ttl_seconds=svc.cache_ttl_seconds,
+                        )
+                        for svc in rows
+                    }
+                )
+            finally:
+                if own_session:
+                    db.close()
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+            return snapshot
+
+
+def _service_exists(service_id: int) -> bool:
+    db = ReadSession()
+    try:
+        svc = db.get(models.CloudService, service_id)
+        return svc is not None and svc.deleted_at is None
+    finally:
+        db.close()
+
+
+# Shared catalog for this process; loaded on first use
+service_catalog = ServiceCatalog()
@@ -0,0 +1,381 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+
+from .. import models
+from ..db import SessionLocal
+from .security import decode_access_token
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+# Mutating routes whose responses are saved per Idempotency-Key
+IDEMPOTENT_ROUTES = (
+    ("POST", re.compile(r"^/users/?$")),
+    ("POST", re.compile(r"^/access-controls/?$")),
+    ("GET", re.compile(r"^/services/\d+/call/?$")),
+)
+# How long a saved response is replayed for
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# Number of responses kept in memory in front of the database
+MEMORY_CACHE_SIZE = 10_000
+# Responses larger than this are not saved
+MAX_BODY_BYTES = 1_000_000
+# Client errors that a retry of the same request would get again, so they are
+# saved like successes; anything else (429, 401, 403, 5xx) may change
+REPLAYABLE_ERROR_STATUSES = frozenset({400, 404, 409, 422})
+# How long a duplicate waits for the original request to finish
+MAX_DUPLICATE_WAIT_SECONDS = 30.0
+# How often a duplicate checks on an original running on another worker
+DUPLICATE_POLL_SECONDS = 0.1
+# A claim older than this belongs to a request that died; it can be taken over
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# status_code of a claimed key whose first request is still running
+PENDING_STATUS = 0
+# Expired rows are purged from the database every this many saves
+PURGE_EVERY = 100
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    fingerprint: str
+    status_code: int
+    content_type: str | None
+    body: bytes
+    created_at: datetime
+
+
+class IdempotencyStore:
+    """
+    Saved responses keyed by scoped idempotency key: a bounded in-memory LRU
+    backed by the idempotency_records table. A request claims its key with a
+    pending row before the handler runs, so a duplicate on any worker waits
+    for the original instead of running again; duplicates on the same worker
+    also wait on an in-memory future rather than polling.
+    """
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._saves = 0
+
+    def remembered(self, key: str) -> CachedResponse | None:
+        # A saved response held in memory, if it has not expired.
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        if cached.created_at < datetime.utcnow() - IDEMPOTENCY_TTL:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return cached
+
+    async def claim(
+        self, key: str, fingerprint: str
+    ) -> tuple[bool, CachedResponse | None]:
+        # (True, None) if this request now owns the key, else (False, the
+        # saved or pending response holding it, or None if it was released).
+        claimed, cached = await run_in_threadpool(_claim_record, key, fingerprint)
+        if cached is not None and cached.status_code != PENDING_STATUS:
+            self._remember(key, cached)
+        return claimed, cached
+
+    async def put(self, key: str, cached: CachedResponse) -> None:
+        self._remember(key, cached)
+        self._saves += 1
+        purge = self._saves % PURGE_EVERY == 0
+        await run_in_threadpool(_save_record, key, cached, purge)
+
+    def release(self, key: str) -> None:
+        # Drop an unsaved claim so a retry can run. Not awaited, so it still
+        # happens when the request is being cancelled.
+        asyncio.get_running_loop().run_in_executor(None, _release_claim, key)
+
+    def _remember(self, key: str, cached: CachedResponse) -> None:
+        self._entries[key] = cached
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pending(self, key: str) -> asyncio.Future | None:
+        return self._pending.get(key)
+
+    def begin(self, key: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[key] = fut
+        return fut
+
+    def finish(self, key: str, cached: CachedResponse | None) -> None:
+        fut = self._pending.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(cached)
+
+
+def _to_cached(rec: models.IdempotencyRecord) -> CachedResponse:
+    return CachedResponse(
+        fingerprint=rec.fingerprint,
+        status_code=rec.status_code,
+        content_type=rec.content_type,
+        body=rec.body,
+        created_at=rec.created_at,
+    )
+
+
+def _claim_record(key: str, fingerprint: str) -> tuple[bool, CachedResponse | None]:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        records = models.IdempotencyRecord
+        # An expired response, or a claim whose request died, no longer holds
+        # the key
+        db.query(records).filter(
+            records.key == key,
+            or_(
+                records.created_at < now - IDEMPOTENCY_TTL,
+                and_(
+                    records.status_code == PENDING_STATUS,
+                    records.created_at < now - CLAIM_TIMEOUT,
+                ),
+            ),
+        ).delete(synchronize_session=False)
+        db.add(
+            records(
+                key=key,
+                fingerprint=fingerprint,
+                status_code=PENDING_STATUS,
+                body=b"",
+                created_at=now,
+            )
+        )
+        try:
+            db.commit()
+            return True, None
+        except IntegrityError:
+            # Claimed or saved by another request first
+            db.rollback()
+        rec = db.query(records).filter_by(key=key).first()
+        return False, _to_cached(rec) if rec is not None else None
+    finally:
+        db.close()
+
+
+def _save_record(key: str, cached: CachedResponse, purge: bool) -> None:
+    # Replace this request's pending claim with its response.
+    db = SessionLocal()
+    try:
+        if purge:
+            cutoff = datetime.utcnow() - IDEMPOTENCY_TTL
+            db.query(models.IdempotencyRecord).filter(
+                models.IdempotencyRecord.created_at < cutoff
+            ).delete(synchronize_session=False)
+        db.query(models.IdempotencyRecord).filter(
+            models.IdempotencyRecord.key == key
+        ).update(
+            {
+                "fingerprint": cached.fingerprint,
+                "status_code": cached.status_code,
+                "content_type": cached.content_type,
+                "body": cached.body,
+                "created_at": cached.created_at,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _release_claim(key: str) -> None:
+    db = SessionLocal()
+    try:
+        db.query(models.IdempotencyRecord).filter(
+            models.IdempotencyRecord.key == key,
+            models.IdempotencyRecord.status_code == PENDING_STATUS,
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+# Shared store used by the middleware
+idempotency_store = IdempotencyStore()
+
+
+def _is_idempotent_route(method: str, path: str) -> bool:
+    return any(m == method and rx.match(path) for m, rx in IDEMPOTENT_ROUTES)
+
+
+def _caller(headers: dict) -> bytes:
+    # The authenticated subject, so a retry with a refreshed token still
+    # matches; empty for anonymous callers and invalid tokens.
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.lower().startswith("bearer "):
+        return b""
+    return str(decode_access_token(auth[7:]).get("sub", "")).encode()
+
+
+def _digest(*parts: bytes) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _replay(cached: CachedResponse) -> Response:
+    return Response(
+        content=cached.body,
+        status_code=cached.status_code,
+        media_type=cached.content_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _is_idempotent_route(
+            scope["method"], scope["path"]
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        idem_key = headers.get(IDEMPOTENCY_HEADER.encode())
+        if not idem_key:
+            await self.app(scope, receive, send)
+            return
+
+        # Scope keys to the caller so one client can never replay another's response
+        method = scope["method"].encode()
+        path = scope["path"].encode()
+        key = _digest(_caller(headers), method, path, idem_key)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                # The client gave up mid-body; running the handler on a
+                # truncated body would save its error for the retry to get
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        fingerprint = _digest(method, path, scope["query_string"], body)
+
+        while True:
+            fut = self.store.pending(key)
+            if fut is None:
+                break
+            # A request with this key is running; wait for its response
+            try:
+                cached = await asyncio.wait_for(
+                    asyncio.shield(fut), MAX_DUPLICATE_WAIT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                await self._in_progress(scope, receive, send)
+                return
+            if cached is not None:
+                await self._respond(cached, fingerprint, scope, receive, send)
+                return
+            # The original failed without a saved response; run this one instead
+
+        self.store.begin(key)
+        cached = None
+        claimed = saved = False
+        try:
+            cached = self.store.remembered(key)
+            deadline = time.monotonic() + MAX_DUPLICATE_WAIT_SECONDS
+            while cached is None:
+                claimed, cached = await self.store.claim(key, fingerprint)
+                if claimed or (cached and cached.status_code != PENDING_STATUS):
+                    break
+                # The original is running on another worker; wait for its row
+                cached = None
+                if time.monotonic() >= deadline:
+                    await self._in_progress(scope, receive, send)
+                    return
+                await asyncio.sleep(DUPLICATE_POLL_SECONDS)
+            if not claimed:
+                await self._respond(cached, fingerprint, scope, receive, send)
+                return
+            cached = await self._run(scope, receive, send, body, fingerprint)
+            if cached is not None:
+                await self.store.put(key, cached)
+                saved = True
+        finally:
+            if claimed and not saved:
+                self.store.release(key)
+            self.store.finish(key, cached if saved or not claimed else None)
+
+    async def _in_progress(self, scope, receive, send):
+        response = JSONResponse(
+            {"detail": "A request with this Idempotency-Key is in progress"},
+            status_code=409,
+        )
+        await response(scope, receive, send)
+
+    async def _respond(self, cached, fingerprint, scope, receive, send):
+        if cached.fingerprint != fingerprint:
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"},
+                status_code=422,
+            )
+        else:
+            response = _replay(cached)
+        await response(scope, receive, send)
+
+    async def _run(self, scope, receive, send, body, fingerprint):
+        # Run the handler with the buffered body and capture its response.
+        replayed = False
+
+        async def receive_body():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status_code = 500
+        content_type = None
+        chunks = []
+        size = 0
+
+        async def capture(message):
+            nonlocal status_code, content_type, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        content_type = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= MAX_BODY_BYTES:
+                    chunks.append(chunk)
+            await send(message)
+
+        await self.app(scope, receive_body, capture)
+
+        # Only deterministic outcomes are saved; a retry of anything else
+        # (rate limits, auth failures, server errors) runs the handler again
+        saved = 200 <= status_code < 300 or status_code in REPLAYABLE_ERROR_STATUSES
+        if not saved or size > MAX_BODY_BYTES:
+            return None
+        return CachedResponse(
+            fingerprint=fingerprint,
+            status_code=status_code,
+            content_type=content_type,
+            body=b"".join(chunks),
+            created_at=datetime.utcnow(),
+        )
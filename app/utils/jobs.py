@@ -0,0 +1,38 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Named single-thread executors of this worker process
+_executors: dict[str, ThreadPoolExecutor] = {}
+_pid = None
+_lock = threading.Lock()
+
+
+def submit(name: str, fn, *args) -> Future:
+    """
+    Run fn(*args) on this process's `name` thread, one job at a time. Used for
+    work that outlives a request, which a BackgroundTask would keep inside the
+    request's admission slot until it finished. Threads are created on first
+    use, so a forked worker never inherits its parent's (dead) ones.
+    """
+    global _pid
+    with _lock:
+        if _pid != os.getpid():
+            _executors.clear()
+            _pid = os.getpid()
+        executor = _executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+            _executors[name] = executor
+    future = executor.submit(fn, *args)
+    # Nobody waits on the future, so an uncaught error would otherwise vanish
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _log_failure(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background job failed", exc_info=future.exception())
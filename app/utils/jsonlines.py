@@ -0,0 +1,86 @@
+import json
+import os
+import queue
+import threading
+
+# Records waiting to be written before new ones are dropped
+MAX_QUEUED_RECORDS = 10_000
+# Records written per batch
+BATCH_SIZE = 500
+# How long close() waits for queued records to be written
+CLOSE_TIMEOUT_SECONDS = 5.0
+
+_CLOSE = object()
+
+
+class JsonLinesWriter:
+    """
+    Appends one compact JSON line per record from a background thread, so
+    callers on the event loop only enqueue. Each worker process starts its own
+    thread and append-mode handle on first use, so workers can share a file.
+    When the disk falls behind, records are dropped and counted rather than
+    queued without bound.
+    """
+
+    def __init__(self, path: str, name: str = "jsonlines"):
+        self.path = path
+        self.name = name
+        self.dropped = 0
+        self._queue: queue.Queue | None = None
+        self._thread: threading.Thread | None = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        q = self._queue if self._pid == os.getpid() else self._start()
+        try:
+            q.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> queue.Queue:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(MAX_QUEUED_RECORDS)
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name=self.name, daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+        return self._queue
+
+    def _run(self, q: queue.Queue) -> None:
+        with open(self.path, "a") as f:
+            while True:
+                batch = [q.get()]
+                while len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(q.get_nowait())
+                    except queue.Empty:
+                        break
+                done = any(record is _CLOSE for record in batch)
+                f.write(
+                    "".join(
+                        json.dumps(record, separators=(",", ":")) + "\n"
+                        for record in batch
+                        if record is not _CLOSE
+                    )
+                )
+                f.flush()
+                if done:
+                    return
+
+    def close(self) -> None:
+        # Write out what is queued and stop this process's writer thread.
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        # A writer that died (bad path, unserializable record) never drains
+        # the queue, so neither wait may block shutdown indefinitely
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_CLOSE, timeout=CLOSE_TIMEOUT_SECONDS)
+                self._thread.join(CLOSE_TIMEOUT_SECONDS)
+            except queue.Full:
+                pass
+        self._pid = None
+        self._thread = None
@@ -0,0 +1,134 @@
+import secrets
+from datetime import datetime
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..db import SessionLocal
+from .admission import admission
+from .jobs import submit
+
+# Users moved per UPDATE statement / transaction
+MIGRATION_CHUNK_SIZE = 10_000
+# Finished jobs kept for progress lookups
+MAX_TRACKED_JOBS = 100
+
+
+def create_job(
+    db: Session, to_plan_id: int, from_plan_id=None, role=None
+) -> models.PlanMigration:
+    job = models.PlanMigration(
+        id=secrets.token_hex(8),
+        to_plan_id=to_plan_id,
+        from_plan_id=from_plan_id,
+        role=role,
+        status="pending",
+        total=0,
+        moved=0,
+        created_at=datetime.utcnow(),
+    )
+    db.add(job)
+    # Forget finished jobs beyond the newest MAX_TRACKED_JOBS
+    newest = (
+        select(models.PlanMigration.id)
+        .order_by(models.PlanMigration.created_at.desc())
+        .limit(MAX_TRACKED_JOBS)
+    )
+    db.execute(
+        delete(models.PlanMigration).where(
+            models.PlanMigration.finished_at.is_not(None),
+            models.PlanMigration.id.not_in(newest),
+        )
+    )
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: str) -> models.PlanMigration | None:
+    return db.get(models.PlanMigration, job_id)
+
+
+def _selected(job: models.PlanMigration):
+    # Users matching the job's filter who are not on the target plan yet.
+    # Moved rows stop matching, so each chunk picks up where the last ended.
+    users = models.User
+    conditions = [or_(users.plan_id.is_(None), users.plan_id != job.to_plan_id)]
+    if job.from_plan_id is not None:
+        conditions.append(users.plan_id == job.from_plan_id)
+    if job.role is not None:
+        conditions.append(users.role == job.role)
+    return conditions
+
+
+def run_plan_migration(job_id: str, chunk_size: int = MIGRATION_CHUNK_SIZE) -> None:
+    """
+    Move every matching user to the target plan with set-based UPDATEs of at
+    most chunk_size rows, recording progress in the same transaction as each
+    chunk. Picks up where it stopped when run again for an unfinished job.
+    """
+    db = SessionLocal()
+    try:
+        job = get_job(db, job_id)
+        if job is None or job.finished_at is not None:
+            return
+        conditions = _selected(job)
+        if job.started_at is None:
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            job.total = db.query(models.User.id).filter(*conditions).count()
+            db.commit()
+        chunk = (
+            select(models.User.id).where(*conditions).limit(chunk_size)
+        ).scalar_subquery()
+        while True:
+            result = db.execute(
+                update(models.User)
+                .where(models.User.id.in_(chunk))
+                .values(plan_id=job.to_plan_id)
+            )
+            db.execute(
+                update(models.PlanMigration)
+                .where(models.PlanMigration.id == job_id)
+                .values(moved=models.PlanMigration.moved + result.rowcount)
+            )
+            db.commit()
+            # Queue priority is derived from the plan; drop cached weights
+            admission.invalidate_weights()
+            if result.rowcount < chunk_size:
+                break
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        db.execute(
+            update(models.PlanMigration)
+            .where(models.PlanMigration.id == job_id)
+            .values(status="failed", error=str(exc), finished_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_plan_migration(job_id: str) -> None:
+    # Run the job on this worker's migration thread, off the request.
+    submit("plan-migration", run_plan_migration, job_id)
+
+
+def resume_plan_migrations() -> None:
+    # Restart jobs interrupted by a crash or restart. Every worker does this
+    # at startup; moved rows stop matching, so overlapping runs are harmless.
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(models.PlanMigration.id)
+            .filter(models.PlanMigration.finished_at.is_(None))
+            .all()
+        )
+    finally:
+        db.close()
+    for (job_id,) in pending:
+        start_plan_migration(job_id)
@@ -0,0 +1,174 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+# Time between stack samples
+SAMPLE_INTERVAL_SECONDS = 0.005
+MAX_PROFILE_SECONDS = 60
+# Functions always reported in the hot-spot summary, besides the routers
+HOTSPOT_FUNCTIONS = ("verify_access", "get_current_user")
+# Leaf frames (file, function) of threads that are parked waiting for work
+IDLE_FRAMES = frozenset(
+    {
+        ("threading.py", "wait"),
+        ("queue.py", "get"),
+        ("selectors.py", "select"),
+        ("socket.py", "accept"),
+    }
+)
+
+_APP_DIR = Path(__file__).resolve().parent.parent
+_ROUTERS_DIR = _APP_DIR / "routers"
+
+
+class ProfilerBusy(Exception):
+    # Raised when a profile is already running in this worker.
+    pass
+
+
+def _label(code) -> str:
+    path = Path(code.co_filename)
+    try:
+        filename = str(path.relative_to(_APP_DIR.parent))
+    except ValueError:
+        filename = path.name
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _is_idle(code) -> bool:
+    return (Path(code.co_filename).name, code.co_name) in IDLE_FRAMES
+
+
+def _is_hotspot(code) -> bool:
+    return code.co_name in HOTSPOT_FUNCTIONS or Path(code.co_filename).is_relative_to(
+        _ROUTERS_DIR
+    )
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread in this process (the event loop and the
+    threadpool running sync endpoints and dependencies) at a fixed interval,
+    from a thread of its own so the workers are never instrumented. Ticks only
+    record raw code objects; labels and hot spots are worked out once per code
+    object when the profile is summarized.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    async def profile(self, seconds: float, include_idle: bool = False) -> dict:
+        # Run on a dedicated thread rather than the AnyIO threadpool, which
+        # would give up one of its worker tokens for the whole profile.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def settle(set_outcome, value):
+            # Cancelling the request cancels the future; drop the outcome then
+            if not future.done():
+                set_outcome(value)
+
+        def target():
+            try:
+                result = self.run(seconds, include_idle=include_idle)
+            except BaseException as exc:
+                loop.call_soon_threadsafe(settle, future.set_exception, exc)
+            else:
+                loop.call_soon_threadsafe(settle, future.set_result, result)
+
+        threading.Thread(target=target, name="profiler", daemon=True).start()
+        return await future
+
+    def run(
+        self,
+        seconds: float,
+        interval: float = SAMPLE_INTERVAL_SECONDS,
+        include_idle: bool = False,
+    ) -> dict:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            return self._sample(seconds, interval, include_idle)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float, include_idle: bool) -> dict:
+        me = threading.get_ident()
+        names = {}
+        # (thread name, root-first tuple of code objects) -> samples
+        stacks: Counter = Counter()
+        idle_codes: dict = {}
+        ticks = 0
+        deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+
+        while time.monotonic() < deadline:
+            if ticks % 100 == 0:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if not include_idle:
+                    code = frame.f_code
+                    idle = idle_codes.get(code)
+                    if idle is None:
+                        idle = idle_codes[code] = _is_idle(code)
+                    if idle:
+                        continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                stacks[(names.get(tid, tid), tuple(codes))] += 1
+            ticks += 1
+            time.sleep(interval)
+
+        return self._summarize(seconds, ticks, stacks)
+
+    def _summarize(self, seconds: float, ticks: int, stacks: Counter) -> dict:
+        labels = {}
+        hotspots = {}
+        for _, codes in stacks:
+            for code in codes:
+                if code not in labels:
+                    labels[code] = _label(code)
+                    hotspots[code] = _is_hotspot(code)
+
+        collapsed: Counter = Counter()
+        hot_inclusive: Counter = Counter()
+        hot_self: Counter = Counter()
+        for (thread, codes), count in stacks.items():
+            thread = str(thread).replace(";", ":")
+            collapsed[";".join([thread] + [labels[c] for c in codes])] += count
+            for code in set(codes):
+                if hotspots[code]:
+                    hot_inclusive[labels[code]] += count
+            if hotspots[codes[-1]]:
+                hot_self[labels[codes[-1]]] += count
+
+        samples = sum(stacks.values())
+        return {
+            "seconds": seconds,
+            "ticks": ticks,
+            "samples": samples,
+            # One "frame;frame;... count" line per stack, for flamegraph.pl et al.
+            "collapsed": "".join(
+                f"{stack} {count}\n" for stack, count in collapsed.most_common()
+            ),
+            "hotspots": [
+                {
+                    "function": function,
+                    "inclusive": count,
+                    "self": hot_self[function],
+                    "inclusive_pct": round(100 * count / samples, 2) if samples else 0,
+                }
+                for function, count in hot_inclusive.most_common()
+            ],
+        }
+
+
+# One profiler per worker process
+profiler = SamplingProfiler()
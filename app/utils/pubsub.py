@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+# Concurrent usage streams allowed per user
+MAX_STREAMS_PER_USER = 3
+# Events buffered per stream before the consumer counts as too slow
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class TooManyStreams(Exception):
+    # Raised when a user already has MAX_STREAMS_PER_USER streams open.
+    pass
+
+
+class Subscription:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+    def offer(self, event: dict) -> None:
+        # Runs on the subscriber's event loop. A consumer that has fallen a
+        # full queue behind is dropped instead of buffering without bound.
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            # None tells the stream to close
+            self.queue.put_nowait(None)
+
+
+class UsageBroker:
+    """
+    In-process pub/sub of usage events keyed by user id. Publishing is safe
+    from worker threads and costs nothing when the user has no open streams.
+    """
+
+    def __init__(self):
+        self._subs: dict[int, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        sub = Subscription(user_id)
+        with self._lock:
+            subs = self._subs.setdefault(user_id, set())
+            if len(subs) >= MAX_STREAMS_PER_USER:
+                raise TooManyStreams()
+            subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return user_id in self._subs
+
+    def publish(self, user_id: int, event: dict) -> None:
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down
+                self.unsubscribe(sub)
+
+
+# Shared broker for this process
+usage_broker = UsageBroker()
@@ -0,0 +1,111 @@
+import logging
+import threading
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..db import SessionLocal
+from .jobs import submit
+
+# Usage rows deleted per transaction by the background purge
+PURGE_CHUNK_SIZE = 5000
+# Attempts at a failed purge (e.g. "database is locked" while several workers
+# resume it at startup) before it is left for the next startup
+PURGE_ATTEMPTS = 5
+# Delay before the first retry; doubled for each later one
+PURGE_RETRY_SECONDS = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+def needs_background_purge(db: Session, service_id: int) -> bool:
+    # True when the service has more usage rows than one purge chunk.
+    return (
+        db.query(models.UsageRecord.id)
+        .filter(models.UsageRecord.service_id == service_id)
+        .offset(PURGE_CHUNK_SIZE)
+        .first()
+        is not None
+    )
+
+
+def purge_chunk_statement(service_id: int, chunk_size: int = PURGE_CHUNK_SIZE):
+    # Deletes the next chunk_size of the service's usage rows
+    chunk = (
+        select(models.UsageRecord.id)
+        .where(models.UsageRecord.service_id == service_id)
+        .limit(chunk_size)
+        .scalar_subquery()
+    )
+    return delete(models.UsageRecord).where(models.UsageRecord.id.in_(chunk))
+
+
+def purge_service(service_id: int, chunk_size: int = PURGE_CHUNK_SIZE) -> None:
+    """
+    Delete a tombstoned service's usage history in short transactions, then
+    the service itself, so the write lock is never held for the whole history
+    at once. Safe to run again after a crash, or twice at once.
+    """
+    db = SessionLocal()
+    try:
+        statement = purge_chunk_statement(service_id, chunk_size)
+        while True:
+            result = db.execute(statement)
+            db.commit()
+            if result.rowcount < chunk_size:
+                break
+        db.execute(
+            delete(models.CloudService).where(
+                models.CloudService.id == service_id,
+                models.CloudService.deleted_at.is_not(None),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def schedule_purge(service_id: int, attempt: int = 1) -> None:
+    # Queue the purge on this worker's purge thread.
+    submit("purge", _run_purge, service_id, attempt)
+
+
+def _run_purge(service_id: int, attempt: int) -> None:
+    try:
+        purge_service(service_id)
+    except Exception:
+        if attempt >= PURGE_ATTEMPTS:
+            logger.exception(
+                "Purge of service %s failed %s times; it resumes at next startup",
+                service_id,
+                attempt,
+            )
+            return
+        delay = PURGE_RETRY_SECONDS * 2 ** (attempt - 1)
+        logger.warning(
+            "Purge of service %s failed, retrying in %ss",
+            service_id,
+            delay,
+            exc_info=True,
+        )
+        # Wait on a timer rather than the purge thread, so other purges go on
+        retry = threading.Timer(delay, schedule_purge, (service_id, attempt + 1))
+        retry.daemon = True
+        retry.start()
+
+
+def resume_purges() -> None:
+    # Restart purges interrupted by a crash or restart. Every worker does
+    # this at startup; overlapping purges of one service are harmless.
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(models.CloudService.id)
+            .filter(models.CloudService.deleted_at.is_not(None))
+            .all()
+        )
+    finally:
+        db.close()
+    for (service_id,) in pending:
+        schedule_purge(service_id)
@@ -0,0 +1,101 @@
+import os
+import time
+from contextvars import ContextVar
+from urllib.parse import parse_qsl
+
+from .jsonlines import JsonLinesWriter
+
+# JSON-lines file every handled request is appended to; recording is off
+# (and the middleware is not installed) unless this is set
+TRAFFIC_RECORD_PATH = os.environ.get("TRAFFIC_RECORD_PATH")
+# Not recorded: API docs and long-lived event streams
+EXEMPT_PATHS = ("/docs", "/redoc", "/openapi.json", "/usage/me/stream")
+# Only these query parameters are kept; anything else could carry secrets
+RECORDED_QUERY_PARAMS = frozenset(
+    {
+        "skip",
+        "limit",
+        "user_id",
+        "service_id",
+        "permission",
+        "service_name",
+        "plan_id",
+        "role",
+        "since",
+        "until",
+        "min_duration_ms",
+    }
+)
+
+# Fields of the request being recorded, filled in by annotate()
+_current_record: ContextVar[dict | None] = ContextVar("traffic_record", default=None)
+
+
+def annotate(**fields) -> None:
+    # Attach ids (e.g. the authenticated user) to the current record; a
+    # no-op when recording is off.
+    record = _current_record.get()
+    if record is not None:
+        record.update(fields)
+
+
+class TrafficRecorder(JsonLinesWriter):
+    """
+    Appends one compact JSON line per request from a background writer
+    thread. Only metadata is kept: no headers, tokens, bodies or free-form
+    query values.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, name="traffic-recorder")
+
+
+# Shared recorder for this process; None when recording is off
+traffic_recorder = TrafficRecorder(TRAFFIC_RECORD_PATH) if TRAFFIC_RECORD_PATH else None
+
+
+class TrafficRecorderMiddleware:
+    def __init__(self, app, recorder: TrafficRecorder | None = traffic_recorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if (
+            self.recorder is None
+            or scope["type"] != "http"
+            or scope["path"].startswith(EXEMPT_PATHS)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        record = {"ts": round(time.time(), 4), "method": scope["method"]}
+        response_status = None
+
+        async def send_with_status(message):
+            nonlocal response_status
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+            await send(message)
+
+        token = _current_record.set(record)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            _current_record.reset(token)
+            # The router stores the matched route on the scope; ids in the
+            # path are kept as parameters of the route template
+            route = scope.get("route")
+            record["route"] = route.path if route is not None else scope["path"]
+            if scope.get("path_params"):
+                record["params"] = scope["path_params"]
+            query = {
+                k: v
+                for k, v in parse_qsl(scope["query_string"].decode("latin-1"))
+                if k in RECORDED_QUERY_PARAMS
+            }
+            if query:
+                record["query"] = query
+            record["status"] = response_status or 500
+            self.recorder.write(record)
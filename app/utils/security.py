@@ -8,7 +8,9 @@ from passlib.exc import UnknownHashError
 from sqlalchemy.orm import Session
 
 from .. import models
-from ..db import SessionLocal
+from ..db import get_read_db
+from .recorder import annotate
+from .tracing import traced
 
 # Secret key for signing JWTs
 SECRET_KEY = "temp-key"
@@ -24,15 +26,6 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
-def get_db():
-    # Yield a new database session and ensure it is closed after use.
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 def hash_password(password: str) -> str:
     # Hash a plaintext password using bcrypt.
     return pwd_context.hash(password)
@@ -65,8 +58,9 @@ def decode_access_token(token: str) -> dict:
         return {}
 
 
+@traced("get_current_user")
 def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)
 ) -> models.User:
     # Retrieve the current user based on the JWT Bearer token.
     # Raises 401 if token is invalid or user does not exist.
@@ -84,6 +78,7 @@ def get_current_user(
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise creds_exc
+    annotate(user_id=user.id)
     return user
 
 
@@ -0,0 +1,223 @@
+import functools
+import os
+import random
+import re
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .jsonlines import JsonLinesWriter
+
+# Fraction of requests traced when the caller did not decide already
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+# Optional JSON-lines file that every finished trace is appended to
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+# Finished traces kept in memory for the admin endpoint
+TRACE_BUFFER_SIZE = 1000
+# Longest SQL text stored on a span
+MAX_STATEMENT_CHARS = 300
+
+TRACE_ID_HEADER = "x-trace-id"
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# Incoming X-Trace-Id values must look like the ids generated here
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class Span:
+    name: str
+    trace: "Trace"
+    span_id: str
+    parent_id: str | None
+    start: float
+    end: float | None = None
+    attributes: dict = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round(((self.end or self.start) - self.start) * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    start: float
+    spans: list = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        root = self.spans[0]
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "duration_ms": root.to_dict()["duration_ms"],
+            "spans": [s.to_dict() for s in self.spans],
+        }
+
+
+# Innermost open span of the current request, if it is sampled
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def _new_span(name: str, parent: Span | None, trace: Trace, **attributes) -> Span:
+    s = Span(
+        name=name,
+        trace=trace,
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent else None,
+        start=time.perf_counter(),
+        attributes=attributes,
+    )
+    # list.append is atomic, so spans from threadpool workers are safe
+    trace.spans.append(s)
+    return s
+
+
+@contextmanager
+def span(name: str, **attributes):
+    # Time a block as a child of the current span; a no-op when not sampled.
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    s = _new_span(name, parent, parent.trace, **attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        s.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name: str | None = None):
+    """
+    Wrap a function (e.g. a FastAPI dependency) in a span. functools.wraps
+    keeps the signature visible, so dependency injection is unchanged.
+    """
+
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None and context is not None:
+        context._trace_span = _new_span(
+            "sql", parent, parent.trace, statement=statement[:MAX_STATEMENT_CHARS]
+        )
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_sql_span(conn, cursor, statement, parameters, context, executemany):
+    s = getattr(context, "_trace_span", None)
+    if s is not None:
+        s.end = time.perf_counter()
+
+
+class TraceExporter:
+    # Ring buffer of finished traces, optionally mirrored to a JSON-lines file
+    # written from a background thread.
+
+    def __init__(self, path: str | None = TRACE_EXPORT_PATH):
+        self.path = path
+        self._buffer: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+        self._writer = JsonLinesWriter(path, name="trace-export") if path else None
+
+    def export(self, trace: Trace) -> None:
+        data = trace.to_dict()
+        self._buffer.append(data)
+        if self._writer is not None:
+            self._writer.write(data)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+    def slowest(self, min_duration_ms: float = 0, limit: int = 20) -> list[dict]:
+        traces = [t for t in list(self._buffer) if t["duration_ms"] >= min_duration_ms]
+        traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+        return traces[:limit]
+
+
+trace_exporter = TraceExporter()
+
+
+def _incoming_context(headers: dict) -> tuple[str | None, str | None, bool | None]:
+    # (trace_id, parent span id, sampled) propagated by the caller, if any.
+    match = _TRACEPARENT.match(headers.get(b"traceparent", b"").decode("latin-1"))
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        return trace_id, parent_id, bool(int(flags, 16) & 1)
+    trace_id = headers.get(TRACE_ID_HEADER.encode(), b"").decode("latin-1")
+    if not _TRACE_ID.match(trace_id):
+        # Missing or malformed: start a new trace rather than echo it back
+        trace_id = None
+    return trace_id, None, None
+
+
+class TracingMiddleware:
+    def __init__(self, app, exporter: TraceExporter = trace_exporter):
+        self.app = app
+        self.exporter = exporter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = _incoming_context(dict(scope["headers"]))
+        trace_id = trace_id or secrets.token_hex(16)
+        # Head-based sampling: decided once, before any work is done
+        if sampled is None:
+            sampled = random.random() < TRACE_SAMPLE_RATE
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((TRACE_ID_HEADER.encode(), trace_id.encode()))
+                message = {**message, "headers": headers}
+                if root is not None:
+                    root.attributes["status_code"] = message["status"]
+            await send(message)
+
+        if not sampled:
+            root = None
+            await self.app(scope, receive, send_with_trace_id)
+            return
+
+        trace = Trace(trace_id=trace_id, start=time.perf_counter())
+        root = _new_span(
+            f"{scope['method']} {scope['path']}",
+            None,
+            trace,
+            remote_parent_id=parent_id,
+        )
+        token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            root.end = time.perf_counter()
+            _current_span.reset(token)
+            self.exporter.export(trace)
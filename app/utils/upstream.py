@@ -0,0 +1,212 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+import httpx
+from fastapi import HTTPException, status
+
+from .catalog import ServiceEntry
+from .tracing import span
+
+# Used for services without a timeout or concurrency cap of their own
+DEFAULT_TIMEOUT_SECONDS = 10.0
+DEFAULT_MAX_CONCURRENCY = 50
+# Keep-alive pool shared by every service in a worker process
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+KEEPALIVE_EXPIRY_SECONDS = 30.0
+# Cached upstream responses kept per worker, and the largest body cached
+CACHE_MAX_ENTRIES = 2048
+CACHE_MAX_BODY_BYTES = 1_000_000
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+_UNCACHEABLE = ("no-store", "no-cache", "private")
+
+
+@dataclass(frozen=True)
+class UpstreamResponse:
+    status_code: int
+    content_type: str | None
+    body: bytes
+    cached: bool = False
+
+
+def _cache_ttl(svc: ServiceEntry, resp: httpx.Response) -> float:
+    # Seconds a response may be cached for: the service TTL, shortened by the
+    # upstream's max-age; 0 for errors and anything marked uncacheable.
+    if not svc.cache_ttl_seconds or resp.status_code != 200:
+        return 0
+    if "set-cookie" in resp.headers or len(resp.content) > CACHE_MAX_BODY_BYTES:
+        return 0
+    cache_control = resp.headers.get("cache-control", "").lower()
+    if any(directive in cache_control for directive in _UNCACHEABLE):
+        return 0
+    max_age = _MAX_AGE.search(cache_control)
+    if max_age:
+        return min(svc.cache_ttl_seconds, int(max_age.group(1)))
+    return svc.cache_ttl_seconds
+
+
+class ResponseCache:
+    # Bounded LRU of upstream responses with a per-entry expiry time.
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, UpstreamResponse]] = (
+            OrderedDict()
+        )
+
+    def get(self, key: tuple) -> UpstreamResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, key: tuple, response: UpstreamResponse, ttl: float):
+        # Store the response; returns the copy later callers will be served.
+        cached = replace(response, cached=True)
+        self._entries[key] = (time.monotonic() + ttl, cached)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, service_id: int) -> None:
+        for key in [k for k in self._entries if k[0] == service_id]:
+            del self._entries[key]
+
+
+class UpstreamProxy:
+    """
+    Forwards service calls to their upstream backends over one pooled
+    keep-alive client per worker. Each service gets a concurrency cap and a
+    timeout, and GETs of services with a cache TTL are served from a shared
+    response cache, with concurrent misses for the same URL coalesced into a
+    single upstream request.
+    """
+
+    def __init__(self):
+        self.cache = ResponseCache()
+        self._client: httpx.AsyncClient | None = None
+        self._pid = None
+        # service id -> (cap, semaphore)
+        self._slots: dict[int, tuple[int, asyncio.Semaphore]] = {}
+        self._pending: dict[tuple, asyncio.Future] = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use, so a forked worker never shares its parent's
+        # connections
+        if self._client is None or self._pid != os.getpid():
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            )
+            self._pid = os.getpid()
+            self._slots = {}
+            self._pending = {}
+        return self._client
+
+    def _semaphore(self, svc: ServiceEntry) -> asyncio.Semaphore:
+        cap = svc.upstream_max_concurrency or DEFAULT_MAX_CONCURRENCY
+        slot = self._slots.get(svc.id)
+        # A changed cap takes effect for new calls; callers already holding
+        # the old semaphore release it as usual
+        if slot is None or slot[0] != cap:
+            slot = (cap, asyncio.Semaphore(cap))
+            self._slots[svc.id] = slot
+        return slot[1]
+
+    async def call(self, svc: ServiceEntry, query: str = "") -> UpstreamResponse:
+        client = self._http()
+        if not svc.cache_ttl_seconds:
+            response, _ = await self._fetch(client, svc, query)
+            return response
+
+        key = (svc.id, svc.upstream_url, query)
+        while True:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            # Another request is already fetching this URL; share its result.
+            # None means it failed or was uncacheable, so try again.
+            shared = await asyncio.shield(pending)
+            if shared is not None:
+                return shared
+
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[key] = fut
+        shared = None
+        try:
+            response, ttl = await self._fetch(client, svc, query)
+            if ttl > 0:
+                shared = self.cache.put(key, response, ttl)
+            return response
+        finally:
+            del self._pending[key]
+            fut.set_result(shared)
+
+    async def _fetch(
+        self, client: httpx.AsyncClient, svc: ServiceEntry, query: str
+    ) -> tuple[UpstreamResponse, float]:
+        # One upstream GET within the service's concurrency cap and timeout;
+        # returns the response and how long it may be cached for.
+        timeout = svc.upstream_timeout_seconds or DEFAULT_TIMEOUT_SECONDS
+        deadline = time.monotonic() + timeout
+        sem = self._semaphore(svc)
+        try:
+            await asyncio.wait_for(sem.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Too many concurrent calls to '{svc.name}'",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            with span("upstream.request", service_id=svc.id):
+                resp = await client.get(
+                    svc.upstream_url,
+                    params=httpx.QueryParams(query),
+                    timeout=max(deadline - time.monotonic(), 0.001),
+                )
+        except httpx.TimeoutException:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail=f"Upstream for '{svc.name}' timed out",
+            )
+        except httpx.HTTPError:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Upstream for '{svc.name}' is unavailable",
+            )
+        finally:
+            sem.release()
+
+        response = UpstreamResponse(
+            status_code=resp.status_code,
+            content_type=resp.headers.get("content-type"),
+            body=resp.content,
+        )
+        return response, _cache_ttl(svc, resp)
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._pid == os.getpid():
+            await self._client.aclose()
+        self._client = None
+
+
+# Shared proxy for this process
+upstream_proxy = UpstreamProxy()
@@ -0,0 +1,151 @@
+"""
+Mixed read/write benchmark for the database routing in app/db.py.
+
+Runs writer threads that record usage the way call_service does alongside
+reader threads issuing the access-check and usage queries, first with every
+query on the primary pool ("shared") and then with reads on the read pool
+("routed"), and prints throughput and read latency for each.
+
+    python scripts/bench_read_write.py --readers 8 --writers 2 --seconds 10
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import models  # noqa: E402
+from app.db import create_engines, upgrade_database  # noqa: E402
+
+USERS = 200
+SERVICES = 20
+
+
+def seed(Session) -> None:
+    db = Session()
+    db.add_all(
+        models.User(username=f"u{i}", email=f"u{i}@x", hashed_password="x")
+        for i in range(USERS)
+    )
+    db.add_all(models.CloudService(name=f"s{i}") for i in range(SERVICES))
+    db.flush()
+    db.add_all(
+        models.AccessControl(user_id=u + 1, service_id=s + 1, permission="read")
+        for u in range(USERS)
+        for s in range(SERVICES)
+    )
+    db.commit()
+    db.close()
+
+
+def read_once(db, n: int) -> None:
+    user_id, service_id = n % USERS + 1, n % SERVICES + 1
+    db.query(models.AccessControl).filter_by(
+        user_id=user_id, service_id=service_id, permission="read"
+    ).first()
+    db.query(models.UsageRecord).filter(
+        models.UsageRecord.user_id == user_id,
+        models.UsageRecord.service_id == service_id,
+        models.UsageRecord.timestamp >= datetime.utcnow() - timedelta(minutes=1),
+    ).count()
+
+
+def write_once(db, n: int) -> None:
+    db.add(models.UsageRecord(user_id=n % USERS + 1, service_id=n % SERVICES + 1))
+    db.commit()
+
+
+def run(WriteSession, ReadSession, readers: int, writers: int, seconds: float):
+    stop = threading.Event()
+    read_latencies: list[float] = []
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader(seed: int):
+        n, local = seed, []
+        while not stop.is_set():
+            start = time.perf_counter()
+            db = ReadSession()
+            try:
+                read_once(db, n)
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+            finally:
+                db.close()
+            local.append(time.perf_counter() - start)
+            n += 7
+        with lock:
+            read_latencies.extend(local)
+            counts["reads"] += len(local)
+
+    def writer(seed: int):
+        n, done = seed, 0
+        while not stop.is_set():
+            db = WriteSession()
+            try:
+                write_once(db, n)
+                done += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+            finally:
+                db.close()
+            n += 13
+        with lock:
+            counts["writes"] += done
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    read_latencies.sort()
+    q = statistics.quantiles(read_latencies, n=100) if len(read_latencies) > 1 else [0]
+    return {
+        "reads/s": counts["reads"] / seconds,
+        "writes/s": counts["writes"] / seconds,
+        "read p50 ms": q[49] * 1000 if len(q) > 49 else 0,
+        "read p95 ms": q[94] * 1000 if len(q) > 94 else 0,
+        "read p99 ms": q[98] * 1000 if len(q) > 98 else 0,
+        "errors": counts["errors"],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        primary, read = create_engines(f"sqlite:///{tmp}/bench.db")
+        upgrade_database(primary)
+        WriteSession = sessionmaker(bind=primary)
+        ReadSession = sessionmaker(bind=read)
+        seed(WriteSession)
+
+        for mode, reads in (("shared", WriteSession), ("routed", ReadSession)):
+            result = run(WriteSession, reads, args.readers, args.writers, args.seconds)
+            print(mode, " ".join(f"{k}={v:.1f}" for k, v in result.items()))
+
+        primary.dispose()
+        read.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""
+Benchmark and check the upstream proxy behind /services/{id}/call.
+
+Starts a stand-in upstream server that answers after --upstream-latency-ms and
+counts the requests it sees, and the API on a fresh database, then drives
+concurrent calls through an uncached and a cached service and prints
+throughput and latency for each, alongside how many requests reached the
+upstream and its peak concurrency. It also checks that the per-service
+concurrency cap holds, that cached GETs are served without upstream requests,
+that slow and unreachable upstreams map to 504 and 502 without counting as
+usage, and that calls still in flight count against the rate limit. Exits 1
+on any failed check.
+
+    python scripts/bench_upstream.py --concurrency 64 --seconds 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+BOOT_TIMEOUT_SECONDS = 30
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_stand_in(port: int, latency_ms: float) -> None:
+    # Minimal ASGI upstream: sleeps, then returns a cacheable JSON body.
+    import uvicorn
+
+    stats = {"requests": 0, "in_flight": 0, "peak": 0}
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        query = parse_qs(scope["query_string"].decode())
+        if scope["path"] == "/stats":
+            body = json.dumps(stats).encode()
+            if "reset" in query:
+                stats.update(requests=0, peak=0)
+        else:
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["peak"] = max(stats["peak"], stats["in_flight"])
+            try:
+                delay = float(query.get("sleep_ms", [latency_ms])[0])
+                await asyncio.sleep(delay / 1000)
+            finally:
+                stats["in_flight"] -= 1
+            body = json.dumps({"path": scope["path"], "query": query}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"cache-control", b"max-age=60"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    uvicorn.run(app, port=port, log_level="warning", lifespan="off")
+
+
+def start(args: list[str], cwd: str, port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        args,
+        cwd=cwd,
+        env={**os.environ, "TRACE_SAMPLE_RATE": "0"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + BOOT_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{args} did not start")
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    index = round(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, index))]
+
+
+async def load(client, url: str, token: str, concurrency: int, seconds: float):
+    # Closed-loop load: each worker sends its next call as soon as one returns.
+    latencies = []
+    statuses: dict[int, int] = {}
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            resp = await client.get(url, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    latencies.sort()
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def bench(args, api: str, upstream: str, workdir: str) -> list[str]:
+    failures = []
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=api, limits=limits, timeout=60) as client:
+        for name in ("admin", "bench"):
+            await client.post(
+                "/users/",
+                json={"username": name, "email": f"{name}@x", "password": "pw"},
+            )
+        db = sqlite3.connect(Path(workdir) / "cloud_access.db")
+        db.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
+        db.commit()
+        db.close()
+
+        async def login(name: str) -> str:
+            resp = await client.post(
+                "/auth/token", data={"username": name, "password": "pw"}
+            )
+            return resp.json()["access_token"]
+
+        admin, user = await login("admin"), await login("bench")
+        admin_headers = {"Authorization": f"Bearer {admin}"}
+        bench_id = [
+            u["id"]
+            for u in (await client.get("/users/", headers=admin_headers)).json()
+            if u["username"] == "bench"
+        ][0]
+
+        async def service(
+            name: str, rate_limit: int = 1_000_000_000, **upstream_config
+        ) -> int:
+            resp = await client.post(
+                "/services/", json={"name": name}, headers=admin_headers
+            )
+            service_id = resp.json()["id"]
+            # By default effectively no rate limit for the benchmark user
+            db = sqlite3.connect(Path(workdir) / "cloud_access.db")
+            db.execute(
+                "UPDATE cloud_services SET max_calls_per_minute = ? WHERE id = ?",
+                (rate_limit, service_id),
+            )
+            db.commit()
+            db.close()
+            await client.post(
+                "/access-controls/",
+                json={
+                    "user_id": bench_id,
+                    "service_id": service_id,
+                    "permission": "read",
+                },
+                headers=admin_headers,
+            )
+            resp = await client.put(
+                f"/services/{service_id}/upstream",
+                json=upstream_config,
+                headers=admin_headers,
+            )
+            if resp.status_code != 200:
+                failures.append(f"configuring {name}: {resp.status_code} {resp.text}")
+            return service_id
+
+        stub = await service("stub")
+        uncached = await service(
+            "uncached",
+            upstream_url=f"{upstream}/data",
+            upstream_max_concurrency=args.max_concurrency,
+        )
+        cached = await service(
+            "cached", upstream_url=f"{upstream}/data", cache_ttl_seconds=30
+        )
+        slow = await service(
+            "slow", upstream_url=f"{upstream}/data", upstream_timeout_seconds=0.1
+        )
+        down = await service(
+            "down", upstream_url=f"http://127.0.0.1:{free_port()}/data"
+        )
+        limited = await service(
+            "limited", rate_limit=3, upstream_url=f"{upstream}/data"
+        )
+
+        print(
+            f"{'scenario':<10} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}"
+            f" {'upstream reqs':>14} {'peak':>5}  statuses"
+        )
+        scenarios = (("stub", stub), ("uncached", uncached), ("cached", cached))
+        for name, service_id in scenarios:
+            await client.get(f"{upstream}/stats?reset=1")
+            latencies, statuses, elapsed = await load(
+                client,
+                f"/services/{service_id}/call?item=1",
+                user,
+                args.concurrency,
+                args.seconds,
+            )
+            stats = (await client.get(f"{upstream}/stats")).json()
+            print(
+                f"{name:<10} {len(latencies) / elapsed:>8.0f}"
+                f" {percentile(latencies, 50):>8.2f} {percentile(latencies, 95):>8.2f}"
+                f" {percentile(latencies, 99):>8.2f} {stats['requests']:>14}"
+                f" {stats['peak']:>5}  {statuses}"
+            )
+            if set(statuses) != {200}:
+                failures.append(f"{name}: statuses {statuses}")
+            if name == "uncached" and stats["peak"] > args.max_concurrency:
+                failures.append(
+                    f"upstream saw {stats['peak']} concurrent calls, "
+                    f"cap is {args.max_concurrency}"
+                )
+            if name == "cached" and stats["requests"] > 1:
+                failures.append(f"cached service made {stats['requests']} requests")
+
+        headers = {"Authorization": f"Bearer {user}"}
+        resp = await client.get(f"/services/{slow}/call?sleep_ms=500", headers=headers)
+        if resp.status_code != 504:
+            failures.append(f"slow upstream returned {resp.status_code}, not 504")
+        resp = await client.get(f"/services/{down}/call", headers=headers)
+        if resp.status_code != 502:
+            failures.append(
+                f"unreachable upstream returned {resp.status_code}, not 502"
+            )
+        # Failed upstream calls are refunded rather than counted as usage
+        db = sqlite3.connect(Path(workdir) / "cloud_access.db")
+        refunded = db.execute(
+            "SELECT COUNT(*) FROM usage_records WHERE service_id IN (?, ?)",
+            (slow, down),
+        ).fetchone()[0]
+        db.close()
+        if refunded:
+            failures.append(f"{refunded} failed upstream calls were counted")
+
+        # Calls still waiting on the upstream count against the rate limit
+        async def limited_call(delay: float) -> int:
+            await asyncio.sleep(delay)
+            resp = await client.get(
+                f"/services/{limited}/call?sleep_ms=1500", headers=headers
+            )
+            return resp.status_code
+
+        codes = await asyncio.gather(*(limited_call(i * 0.1) for i in range(10)))
+        if sorted(codes) != [200] * 3 + [429] * 7:
+            failures.append(f"rate limit of 3 with slow upstream gave {codes}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--upstream-latency-ms", type=float, default=20)
+    parser.add_argument(
+        "--max-concurrency", type=int, default=16, help="cap on the uncached service"
+    )
+    parser.add_argument("--stand-in", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stand_in:
+        run_stand_in(args.stand_in, args.upstream_latency_ms)
+        return 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        upstream_port, api_port = free_port(), free_port()
+        procs = []
+        try:
+            procs.append(
+                start(
+                    [
+                        sys.executable,
+                        str(Path(__file__).resolve()),
+                        "--stand-in",
+                        str(upstream_port),
+                        "--upstream-latency-ms",
+                        str(args.upstream_latency_ms),
+                    ],
+                    workdir,
+                    upstream_port,
+                )
+            )
+            procs.append(
+                start(
+                    [
+                        sys.executable,
+                        "-m",
+                        "uvicorn",
+                        "--app-dir",
+                        str(ROOT),
+                        "--port",
+                        str(api_port),
+                        "--log-level",
+                        "warning",
+                        "app.main:app",
+                    ],
+                    workdir,
+                    api_port,
+                )
+            )
+            failures = asyncio.run(
+                bench(
+                    args,
+                    f"http://127.0.0.1:{api_port}",
+                    f"http://127.0.0.1:{upstream_port}",
+                    workdir,
+                )
+            )
+        finally:
+            for proc in procs:
+                proc.terminate()
+                proc.wait()
+
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if not failures:
+        print("[ok] upstream proxy")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Multi-process check: run scripts/serve.py with several workers against one
+fresh SQLite database and drive concurrent traffic through it.
+
+Signs users up, grants access and calls a service from many threads at once,
+then checks that no request failed, that every call was recorded exactly
+once, that concurrent retries with one Idempotency-Key run the call once,
+that a plan migration's progress can be polled on every worker, and
+that a killed worker is replaced while the others keep serving.
+Exits 1 on any failure.
+
+    python scripts/check_multiprocess.py --workers 4
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SERVE = Path(__file__).resolve().parent / "serve.py"
+BOOT_TIMEOUT_SECONDS = 30
+# Times a request shed with 503 is retried after its Retry-After
+SHED_RETRIES = 5
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(
+    base: str, method: str, path: str, body=None, token=None, form=False, key=None
+):
+    headers = {}
+    data = None
+    if body is not None and form:
+        data = urllib.parse.urlencode(body).encode()
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    elif body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if key:
+        headers["Idempotency-Key"] = key
+    req = urllib.request.Request(base + path, data, headers, method=method)
+    for attempt in range(SHED_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                return resp.status, json.loads(resp.read() or b"null")
+        except urllib.error.HTTPError as e:
+            # Shed by admission control before reaching the handler; retry
+            if e.code != 503 or attempt == SHED_RETRIES:
+                return e.code, e.read().decode()
+            time.sleep(float(e.headers.get("Retry-After", 1)))
+
+
+class Server:
+    # scripts/serve.py in a subprocess, with the worker pids it reports.
+
+    def __init__(self, workdir: str, port: int, workers: int):
+        self.proc = subprocess.Popen(
+            [
+                sys.executable,
+                str(SERVE),
+                "--workers",
+                str(workers),
+                "--port",
+                str(port),
+            ],
+            cwd=workdir,
+            env={**os.environ, "TRACE_SAMPLE_RATE": "0"},
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        self.workers: list[int] = []
+        self.output: list[str] = []
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self.output.append(line.rstrip())
+            if line.startswith("[serve] booted worker"):
+                self.workers.append(int(line.split()[-1]))
+
+    def wait_ready(self, base: str) -> None:
+        deadline = time.monotonic() + BOOT_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(base + "/openapi.json", timeout=1)
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("server did not start:\n" + "\n".join(self.output))
+
+    def stop(self) -> None:
+        self.proc.send_signal(signal.SIGTERM)
+        try:
+            self.proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=20, help="calls per user")
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        server = Server(workdir, port, args.workers)
+        try:
+            server.wait_ready(base)
+            if len(server.workers) != args.workers:
+                failures.append(f"{len(server.workers)} workers booted")
+            pool = ThreadPoolExecutor(args.threads)
+
+            # Sign-ups land on every worker concurrently
+            names = ["admin"] + [f"user{i}" for i in range(args.users)]
+            statuses = list(
+                pool.map(
+                    lambda n: request(
+                        base,
+                        "POST",
+                        "/users/",
+                        {"username": n, "email": f"{n}@x", "password": "pw"},
+                    )[0],
+                    names,
+                )
+            )
+            if statuses.count(201) != len(names):
+                failures.append(f"sign-up statuses {sorted(set(statuses))}")
+
+            db = sqlite3.connect(Path(workdir) / "cloud_access.db")
+            db.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
+            db.commit()
+
+            def login(name: str) -> str:
+                _, body = request(
+                    base,
+                    "POST",
+                    "/auth/token",
+                    {"username": name, "password": "pw"},
+                    form=True,
+                )
+                return body["access_token"]
+
+            admin = login("admin")
+            _, svc = request(
+                base,
+                "POST",
+                "/services/",
+                {"name": "svc", "description": "", "max_calls_per_minute": 100_000},
+                admin,
+            )
+            user_ids = [
+                u["id"]
+                for u in request(base, "GET", "/users/", token=admin)[1]
+                if u["username"] != "admin"
+            ]
+            grants = list(
+                pool.map(
+                    lambda uid: request(
+                        base,
+                        "POST",
+                        "/access-controls/",
+                        {"user_id": uid, "service_id": svc["id"], "permission": "read"},
+                        admin,
+                    )[0],
+                    user_ids,
+                )
+            )
+            if grants.count(201) != len(user_ids):
+                failures.append(f"grant statuses {sorted(set(grants))}")
+
+            tokens = list(pool.map(login, names[1:]))
+            calls = list(
+                pool.map(
+                    lambda t: request(
+                        base, "GET", f"/services/{svc['id']}/call", token=t
+                    )[0],
+                    [t for t in tokens for _ in range(args.calls)],
+                )
+            )
+            ok = calls.count(200)
+            if ok != len(calls):
+                failures.append(f"call statuses {sorted(set(calls))}")
+            recorded = db.execute("SELECT COUNT(*) FROM usage_records").fetchone()[0]
+            if recorded != ok:
+                failures.append(f"{ok} successful calls but {recorded} usage rows")
+            print(
+                f"{len(calls)} calls across {args.workers} workers, {recorded} recorded"
+            )
+
+            # Concurrent retries of one call, spread over the workers, run once
+            retries = list(
+                pool.map(
+                    lambda _: request(
+                        base,
+                        "GET",
+                        f"/services/{svc['id']}/call",
+                        token=tokens[0],
+                        key="retry-1",
+                    )[0],
+                    range(args.threads),
+                )
+            )
+            extra = (
+                db.execute("SELECT COUNT(*) FROM usage_records").fetchone()[0]
+                - recorded
+            )
+            if set(retries) != {200} or extra != 1:
+                failures.append(
+                    f"{len(retries)} retries of one key gave {sorted(set(retries))} "
+                    f"and {extra} usage rows"
+                )
+
+            # A plan migration started on one worker can be polled on any
+            _, plan = request(base, "POST", "/plans/", {"name": "pro"}, admin)
+            _, job = request(
+                base,
+                "POST",
+                "/users/plan-migrations",
+                {"to_plan_id": plan["id"]},
+                admin,
+            )
+            polls = []
+            deadline = time.monotonic() + BOOT_TIMEOUT_SECONDS
+            while time.monotonic() < deadline:
+                status, body = request(
+                    base, "GET", f"/users/plan-migrations/{job['id']}", token=admin
+                )
+                polls.append(status)
+                if status == 200 and body["status"] in ("completed", "failed"):
+                    break
+                time.sleep(0.05)
+            if set(polls) != {200} or body["moved"] != len(names):
+                failures.append(f"plan migration polls {polls}, last {body}")
+
+            # A dead worker is replaced and the rest keep serving meanwhile
+            victim = server.workers[0]
+            os.kill(victim, signal.SIGKILL)
+            status, _ = request(base, "GET", "/users/", token=admin)
+            if status != 200:
+                failures.append(f"request during restart returned {status}")
+            deadline = time.monotonic() + BOOT_TIMEOUT_SECONDS
+            while len(server.workers) <= args.workers and time.monotonic() < deadline:
+                time.sleep(0.2)
+            if len(server.workers) <= args.workers:
+                failures.append(f"worker {victim} was not replaced")
+            db.close()
+        finally:
+            server.stop()
+
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if not failures:
+        print("[ok] multi-process serving")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Query-plan regression check for the hot access-control, usage and list queries.
+
+Migrates a scratch SQLite database (or the one given with --database-url),
+runs EXPLAIN QUERY PLAN on each query and exits non-zero if any of them falls
+back to a full table scan. The queries come from the same helpers the app
+uses, so changing one of them is enough to fail the check.
+
+    python scripts/check_query_plans.py
+"""
+
+import argparse
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db import upgrade_database  # noqa: E402
+from app.routers.access_controls import access_controls_query  # noqa: E402
+from app.routers.permissions import permissions_query  # noqa: E402
+from app.routers.usage import usage_query  # noqa: E402
+from app.routers.users import users_query  # noqa: E402
+from app.utils.access import grant_query, recent_calls_query  # noqa: E402
+from app.utils.purge import purge_chunk_statement  # noqa: E402
+
+
+# Each check builds its query with the helper the named code path runs, so a
+# change to that code path is what gets explained
+def verify_access_permission(db: Session):
+    return grant_query(db, 1, 1, "read")
+
+
+def verify_access_rate_limit(db: Session):
+    return recent_calls_query(db, 1, 1)
+
+
+def usage_me(db: Session):
+    return usage_query(db, 1)
+
+
+def purge_service_chunk(db: Session):
+    return purge_chunk_statement(1)
+
+
+# List endpoint filters
+def access_controls_by_user(db: Session):
+    return access_controls_query(db, user_id=1)
+
+
+def access_controls_by_service(db: Session):
+    return access_controls_query(db, service_id=1)
+
+
+def access_controls_by_permission(db: Session):
+    return access_controls_query(db, permission="read")
+
+
+def permissions_by_service_name(db: Session):
+    return permissions_query(db, service_name="gaming-api")
+
+
+def users_by_plan(db: Session):
+    return users_query(db, plan_id=1)
+
+
+def users_by_role(db: Session):
+    return users_query(db, role="admin")
+
+
+def usage_me_time_range(db: Session):
+    return usage_query(db, 1, since=datetime(2026, 1, 1), until=datetime(2026, 2, 1))
+
+
+def usage_me_service_time_range(db: Session):
+    return usage_query(db, 1, service_id=1, since=datetime(2026, 1, 1))
+
+
+HOT_QUERIES = [
+    verify_access_permission,
+    verify_access_rate_limit,
+    usage_me,
+    purge_service_chunk,
+    access_controls_by_user,
+    access_controls_by_service,
+    access_controls_by_permission,
+    permissions_by_service_name,
+    users_by_plan,
+    users_by_role,
+    usage_me_time_range,
+    usage_me_service_time_range,
+]
+
+
+def explain(db: Session, query) -> list[str]:
+    # ORM queries carry their Core statement; purge builds a bare DELETE
+    statement = getattr(query, "statement", query)
+    compiled = statement.compile(dialect=db.get_bind().dialect)
+    params = tuple(
+        str(v) if isinstance(v, datetime) else v
+        for v in (compiled.params[name] for name in compiled.positiontup)
+    )
+    rows = db.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + str(compiled), params
+    )
+    # Columns are (id, parent, notused, detail)
+    return [row[3] for row in rows]
+
+
+def check(engine) -> bool:
+    ok = True
+    with Session(engine) as db:
+        for build in HOT_QUERIES:
+            plan = explain(db, build(db))
+            scans = [step for step in plan if step.startswith("SCAN")]
+            status = "FAIL" if scans else "ok"
+            print(f"[{status}] {build.__name__}: {'; '.join(plan)}")
+            ok = ok and not scans
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--database-url",
+        help="check an existing database instead of a freshly migrated one",
+    )
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+        return 0 if check(engine) else 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/plans.db")
+        upgrade_database(engine)
+        ok = check(engine)
+        engine.dispose()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+Replay a recorded workload against a running instance and compare latencies.
+
+Record traffic by starting the server with TRAFFIC_RECORD_PATH set. Records
+are replayed on their original schedule, scaled by --speed (0 sends them as
+fast as --concurrency allows), from a pool of keep-alive connections. Only
+GETs and /auth/token logins are replayed: other writes are recorded without
+bodies and are counted as skipped. Recorded user ids are looked up in the
+target database and logged in with --password (seed.py's shared password),
+so the target must hold the same users, e.g. seed.py data or a copy of the
+recorded database.
+
+Per-route latency percentiles are printed, can be saved with --save and
+compared against an earlier run of another build with --compare.
+
+    TRAFFIC_RECORD_PATH=traffic.jsonl uvicorn app.main:app
+    python scripts/replay_traffic.py traffic.jsonl --speed 4 --save new.json \\
+        --compare old.json --max-regression 20
+"""
+
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import create_engine, select
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import models  # noqa: E402
+from app.db import SQLALCHEMY_DATABASE_URL  # noqa: E402
+
+LOGIN_ROUTE = "/auth/token"
+# Times a request shed with 503 during setup is retried
+SHED_RETRIES = 5
+# Routes with fewer replayed requests are left out of regression checks
+MIN_COMPARE_COUNT = 20
+
+
+def load_records(path: str) -> list[dict]:
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def replayable(record: dict) -> bool:
+    return record["method"] == "GET" or (
+        record["method"] == "POST" and record["route"] == LOGIN_ROUTE
+    )
+
+
+def route_key(record: dict) -> str:
+    return f"{record['method']} {record['route']}"
+
+
+def lookup_usernames(database_url: str, user_ids: set[int]) -> dict[int, str]:
+    engine = create_engine(database_url)
+    users = models.User.__table__
+    ids = sorted(user_ids)
+    names = {}
+    with engine.connect() as conn:
+        for i in range(0, len(ids), 500):
+            rows = conn.execute(
+                select(users.c.id, users.c.username).where(
+                    users.c.id.in_(ids[i : i + 500])
+                )
+            )
+            names.update(dict(rows.all()))
+    engine.dispose()
+    return names
+
+
+class Client:
+    # One keep-alive HTTP connection per thread.
+
+    def __init__(self, base_url: str):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body=None, headers=None):
+        headers = dict(headers or {})
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                self._local.conn = conn
+            try:
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read(), resp.headers
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle connection; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def login(self, username: str, password: str):
+        body = urllib.parse.urlencode({"username": username, "password": password})
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        return self.request("POST", LOGIN_ROUTE, body, headers)
+
+
+def login_all(client: Client, usernames: dict, password: str, pool) -> dict:
+    # Tokens for every recorded user, fetched before the timed replay.
+    def login(username: str) -> str | None:
+        for _ in range(SHED_RETRIES + 1):
+            status, body, headers = client.login(username, password)
+            if status != 503:
+                break
+            time.sleep(float(headers.get("Retry-After", 1)))
+        return json.loads(body)["access_token"] if status == 200 else None
+
+    tokens = dict(zip(usernames, pool.map(login, usernames.values())))
+    return {uid: token for uid, token in tokens.items() if token}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    # Nearest-rank percentile of an already sorted list.
+    index = max(
+        0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+def summarize(latencies: dict[str, list[float]], statuses: dict) -> dict:
+    summary = {}
+    for key, values in sorted(latencies.items()):
+        values = sorted(values)
+        summary[key] = {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(values[-1], 3),
+            "statuses": dict(statuses[key]),
+        }
+    return summary
+
+
+def replay(args, records: list[dict], client: Client, tokens, usernames, pool):
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lag = []
+    lock = threading.Lock()
+
+    def send(record: dict) -> None:
+        key = route_key(record)
+        user_id = record.get("user_id")
+        if record["route"] == LOGIN_ROUTE:
+            username = usernames.get(user_id, "unknown")
+            start = time.perf_counter()
+            status, _, _ = client.login(username, args.password)
+        else:
+            path = record["route"].format_map(record.get("params", {}))
+            if record.get("query"):
+                path += "?" + urllib.parse.urlencode(record["query"])
+            headers = {}
+            if user_id in tokens:
+                headers["Authorization"] = f"Bearer {tokens[user_id]}"
+            start = time.perf_counter()
+            status, _, _ = client.request("GET", path, headers=headers)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies[key].append(elapsed)
+            statuses[key][status] += 1
+
+    first_ts = records[0]["ts"]
+    started = time.perf_counter()
+    futures = []
+    for record in records:
+        if args.speed > 0:
+            due = started + (record["ts"] - first_ts) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # How far behind schedule the replay is running
+            lag.append(max(0.0, time.perf_counter() - due) * 1000)
+        futures.append(pool.submit(send, record))
+    for future in futures:
+        future.result()
+    return summarize(latencies, statuses), time.perf_counter() - started, lag
+
+
+def print_table(summary: dict, baseline: dict | None) -> list[tuple[str, float]]:
+    # Print per-route percentiles; return (route, p95 change %) for routes
+    # with enough requests in both runs to compare.
+    deltas = []
+    header = f"{'route':<44} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}"
+    if baseline is not None:
+        header += f" {'base p95':>9} {'delta':>7}"
+    print(header)
+    for key, stats in summary.items():
+        line = (
+            f"{key:<44} {stats['count']:>6} {stats['p50']:>8.2f} "
+            f"{stats['p95']:>8.2f} {stats['p99']:>8.2f}"
+        )
+        base = (baseline or {}).get(key)
+        if base is not None:
+            delta = 100 * (stats["p95"] - base["p95"]) / max(base["p95"], 1e-9)
+            line += f" {base['p95']:>9.2f} {delta:>+6.1f}%"
+            if min(stats["count"], base["count"]) >= MIN_COMPARE_COUNT:
+                deltas.append((key, delta))
+        print(line)
+    return deltas
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("recording", help="file written via TRAFFIC_RECORD_PATH")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--password", default="password")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="time scale; 0 = no pauses"
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--save", help="write the latency summary to this file")
+    parser.add_argument("--compare", help="summary saved by an earlier run")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="exit 1 if any route's p95 grew by more than this percentage",
+    )
+    args = parser.parse_args()
+
+    records = load_records(args.recording)
+    replayed = [r for r in records if replayable(r)]
+    skipped = Counter(route_key(r) for r in records if not replayable(r))
+    if not replayed:
+        print("nothing to replay")
+        return 1
+
+    client = Client(args.base_url)
+    pool = ThreadPoolExecutor(args.concurrency)
+    user_ids = {r["user_id"] for r in replayed if "user_id" in r}
+    usernames = lookup_usernames(args.database_url, user_ids)
+    tokens = login_all(client, usernames, args.password, pool)
+    print(
+        f"{len(replayed)} requests to replay, {sum(skipped.values())} skipped; "
+        f"{len(tokens)}/{len(user_ids)} recorded users logged in"
+    )
+
+    summary, elapsed, lag = replay(args, replayed, client, tokens, usernames, pool)
+    pool.shutdown()
+    recorded_span = replayed[-1]["ts"] - replayed[0]["ts"]
+    print(
+        f"replayed {recorded_span:.1f}s of traffic in {elapsed:.1f}s "
+        f"({len(replayed) / elapsed:.0f} req/s)"
+    )
+    if lag:
+        lag.sort()
+        print(f"schedule lag p99 {percentile(lag, 99):.1f}ms max {lag[-1]:.1f}ms")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["routes"]
+    deltas = print_table(summary, baseline)
+    for key, count in skipped.most_common():
+        print(f"skipped {count} x {key}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"routes": summary, "seconds": elapsed}, f, indent=2)
+
+    failed = [
+        (key, delta)
+        for key, delta in deltas
+        if args.max_regression is not None and delta > args.max_regression
+    ]
+    for key, delta in failed:
+        print(f"[FAIL] {key}: p95 {delta:+.1f}%")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Seed the database with synthetic users, plans, services, grants and usage.
+
+Rows are written with bulk Core inserts in large transactions, every user
+shares one precomputed bcrypt hash, and all choices come from a seeded RNG,
+so the same arguments always produce the same data. Seeded users log in
+with --password.
+
+    python scripts/seed.py --users 1000000 --services 200 --usage 5000000
+"""
+
+import argparse
+import bisect
+import itertools
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import models  # noqa: E402
+from app.db import SQLALCHEMY_DATABASE_URL, upgrade_database  # noqa: E402
+from app.utils.security import hash_password  # noqa: E402
+
+
+def next_id(conn, table) -> int:
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def insert_batches(conn, table, rows, batch_size: int, total: int) -> None:
+    # Insert an iterable of row dicts in executemany batches, reporting progress.
+    done = 0
+    started = time.perf_counter()
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        conn.execute(table.insert(), batch)
+        done += len(batch)
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"\r{table.name}: {done:,}/{total:,} ({rate:,.0f} rows/s)", end="")
+    print()
+
+
+def skewed_picker(rng: random.Random, n: int, skew: float):
+    # Return a function drawing 0..n-1 with Zipf-like weights, so a few users
+    # and services account for most of the traffic as in production.
+    cumulative = list(itertools.accumulate(1 / (i + 1) ** skew for i in range(n)))
+    top = cumulative[-1]
+    return lambda: bisect.bisect_left(cumulative, rng.random() * top)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--services", type=int, default=50)
+    parser.add_argument("--plans", type=int, default=4)
+    parser.add_argument(
+        "--grants-per-user", type=int, default=3, help="access controls per user"
+    )
+    parser.add_argument("--usage", type=int, default=100_000, help="usage records")
+    parser.add_argument("--days", type=float, default=30, help="usage time span")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent")
+    parser.add_argument("--seed", type=int, default=446)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--prefix", default="load", help="prefix for seeded names")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = create_engine(args.database_url)
+    upgrade_database(engine)
+
+    # bcrypt is deliberately slow, so hash once and share it
+    hashed = hash_password(args.password)
+    users_t = models.User.__table__
+    services_t = models.CloudService.__table__
+    plans_t = models.Plan.__table__
+    perms_t = models.Permission.__table__
+    grants_t = models.AccessControl.__table__
+    usage_t = models.UsageRecord.__table__
+    p = args.prefix
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # Durability is not needed for throwaway load-test data
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        first_service = next_id(conn, services_t)
+        services = range(first_service, first_service + args.services)
+        insert_batches(
+            conn,
+            services_t,
+            (
+                {
+                    "id": sid,
+                    "name": f"{p}-service-{sid}",
+                    "description": f"Synthetic service {sid}",
+                    "max_calls_per_minute": rng.choice((30, 60, 120, 600)),
+                }
+                for sid in services
+            ),
+            args.batch_size,
+            args.services,
+        )
+
+        # Permission names are unique, so each one is tied to a single service
+        first_perm = next_id(conn, perms_t)
+        perm_rows = [
+            {
+                "id": first_perm + i,
+                "name": f"{p}-{perm}-{sid}",
+                "service_name": f"{p}-service-{sid}",
+            }
+            for i, (sid, perm) in enumerate(
+                itertools.product(services, ("read", "write"))
+            )
+        ]
+        insert_batches(conn, perms_t, iter(perm_rows), args.batch_size, len(perm_rows))
+
+        first_plan = next_id(conn, plans_t)
+        plans = range(first_plan, first_plan + args.plans)
+        insert_batches(
+            conn,
+            plans_t,
+            (
+                {
+                    "id": pid,
+                    "name": f"{p}-plan-{pid}",
+                    "description": f"Synthetic tier {n}",
+                    "max_calls_per_minute": 60 * 2**n,
+                }
+                for n, pid in enumerate(plans)
+            ),
+            args.batch_size,
+            args.plans,
+        )
+        # Higher tiers include more of the catalog
+        plan_perm_rows = [
+            {"plan_id": pid, "permission_id": perm["id"]}
+            for n, pid in enumerate(plans)
+            for perm in rng.sample(
+                perm_rows, max(1, len(perm_rows) * (n + 1) // (args.plans + 1))
+            )
+        ]
+        insert_batches(
+            conn,
+            models.plan_permissions,
+            iter(plan_perm_rows),
+            args.batch_size,
+            len(plan_perm_rows),
+        )
+
+        first_user = next_id(conn, users_t)
+        users = range(first_user, first_user + args.users)
+        insert_batches(
+            conn,
+            users_t,
+            (
+                {
+                    "id": uid,
+                    "username": f"{p}-user-{uid}",
+                    "email": f"{p}-user-{uid}@example.com",
+                    "hashed_password": hashed,
+                    "role": "user",
+                    "plan_id": rng.choice(plans) if plans else None,
+                }
+                for uid in users
+            ),
+            args.batch_size,
+            args.users,
+        )
+
+        # Each user's services are derived from (seed, user id) rather than
+        # kept in memory, so grants and usage agree at any scale
+        per_user = min(args.grants_per_user, args.services)
+
+        def services_of(uid: int):
+            return random.Random(f"{args.seed}-{uid}").sample(services, per_user)
+
+        insert_batches(
+            conn,
+            grants_t,
+            (
+                {"user_id": uid, "service_id": sid, "permission": perm}
+                for uid in users
+                for n, sid in enumerate(services_of(uid))
+                # Every grant can read; the first service can also be written
+                for perm in (("read", "write") if n == 0 else ("read",))
+            ),
+            args.batch_size,
+            args.users * (per_user + 1) if per_user else 0,
+        )
+
+        # Usage follows the grants, with a few heavy users dominating
+        if per_user and args.users:
+            pick = skewed_picker(rng, args.users, args.skew)
+            now = datetime.utcnow()
+            span = timedelta(days=args.days).total_seconds()
+
+            def usage_rows():
+                for _ in range(args.usage):
+                    uid = first_user + pick()
+                    sid = services_of(uid)[rng.randrange(per_user)]
+                    yield {
+                        "user_id": uid,
+                        "service_id": sid,
+                        "timestamp": now - timedelta(seconds=rng.random() * span),
+                    }
+
+            insert_batches(conn, usage_t, usage_rows(), args.batch_size, args.usage)
+
+    engine.dispose()
+    print(f"Seeded users log in as '{p}-user-<id>' with password '{args.password}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Pre-fork launcher: serve the app from several worker processes on one port.
+
+The parent imports the app once, applies migrations once, binds the listening
+socket and then forks the workers, so spawning (or respawning) a worker costs
+no import time. Each worker gets fresh connection pools after the fork (see
+app/db.py) and builds its in-process caches lazily on first use. Workers that
+exit unexpectedly are replaced.
+
+    python scripts/serve.py --workers 4 --port 8000
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from pathlib import Path
+
+# Workers skip the startup migration; the parent runs it once before forking
+os.environ["MIGRATE_ON_STARTUP"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import uvicorn  # noqa: E402
+
+from app.db import engine, read_engine, upgrade_database  # noqa: E402
+from app.main import app  # noqa: E402
+
+# Pause before replacing a dead worker, so a crash loop doesn't spin
+RESTART_DELAY_SECONDS = 1.0
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, args) -> None:
+    # Runs in the child; uvicorn installs its own shutdown handlers
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=args.log_level, access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # Never fall back into the parent's supervision loop
+        try:
+            run_worker(sock, args)
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    print(f"[serve] booted worker {pid}", flush=True)
+    return pid
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    upgrade_database()
+    # Close the parent's connections so no SQLite handle crosses the fork
+    engine.dispose()
+    read_engine.dispose()
+
+    workers = {spawn(sock, args) for _ in range(args.workers)}
+    print(f"[serve] listening on http://{args.host}:{args.port}", flush=True)
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if stopping:
+            continue
+        print(f"[serve] worker {pid} exited with status {status}", flush=True)
+        time.sleep(RESTART_DELAY_SECONDS)
+        if not stopping:
+            workers.add(spawn(sock, args))
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())